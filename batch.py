@@ -0,0 +1,303 @@
+"""Step many games in lockstep as NumPy arrays
+
+Follows the same rules as Game.update, but holds every game's tiles,
+positions, directions, timers and scores in arrays so one call to
+BatchGame.step advances all of them at once.
+"""
+
+import numpy as np
+
+import main
+import routing
+from main import Game, Ghost, Tile
+
+# Action codes passed to BatchGame.step
+actions = np.array(
+    [(0, 0), (0, -1), (0, 1), (-1, 0), (1, 0)],  # None, up, down, left, right
+    dtype=np.float64,
+)
+route_dirs = np.array(routing.dirs, dtype=np.float64)
+
+chase = Ghost.State.ChaseScatter.value
+scared = Ghost.State.Scared.value
+eaten = Ghost.State.Eaten.value
+
+
+class BatchGame:
+    def __init__(self, n):
+        template = Game()
+        board = template.board
+        self.n = n
+        self.width = board.width
+        self.height = board.height
+        self.size = np.array([board.width, board.height], dtype=np.float64)
+        self.max_dots = board.max_dots
+        self.start_tiles = np.frombuffer(bytes(board.cells), dtype=np.uint8)
+        self.node = np.array(board.routes.index, dtype=np.intp)
+        self.next_hop = np.frombuffer(bytes(board.routes.next_hop), np.uint8).reshape(
+            board.routes.nodes, board.routes.nodes
+        )
+        self.pac_spawn = np.array(template.pac.spawn, dtype=np.float64)
+        self.ghost_spawn = np.array([g.spawn for g in template.ghosts], np.float64)
+        self.ghost_id = np.array([g.id for g in template.ghosts])
+        self.release = self.ghost_id * 0.1
+        self.g = len(template.ghosts)
+        corners = np.array(
+            [
+                (board.width - 2, 1),
+                (board.width - 2, board.height - 2),
+                (1, 1),
+                (1, board.height - 2),
+            ],
+            dtype=np.float64,
+        )
+        self.scatters = corners[self.ghost_id % 4]
+        self.envs = np.arange(n)
+
+        # Per-game state
+        self.tiles = np.empty((n, self.width * self.height), dtype=np.uint8)
+        self.state = np.empty(n, dtype=np.uint8)
+        self.score = np.empty(n, dtype=np.int64)
+        self.dots_eaten = np.empty(n, dtype=np.int64)
+        self.ghosts_eaten = np.empty(n, dtype=np.int64)
+        self.lives = np.empty(n, dtype=np.int64)
+        self.time = np.empty(n, dtype=np.float64)
+        self.scared_timer = np.empty(n, dtype=np.float64)
+        self.pac_pos = np.empty((n, 2), dtype=np.float64)
+        self.pac_dir = np.empty((n, 2), dtype=np.float64)
+        self.pac_queue = np.empty((n, 2), dtype=np.float64)
+        self.pac_size = np.empty(n, dtype=np.float64)
+
+        # Per-ghost state
+        self.ghost_pos = np.empty((n, self.g, 2), dtype=np.float64)
+        self.ghost_dest = np.zeros((n, self.g, 2), dtype=np.float64)
+        self.has_dest = np.empty((n, self.g), dtype=bool)
+        self.ghost_state = np.empty((n, self.g), dtype=np.uint8)
+        self.scared_spawn = np.empty((n, self.g), dtype=bool)
+
+        self.reset()
+
+    def reset(self, mask=None):
+        """Start new games in the selected environments, or all of them"""
+        mask = np.ones(self.n, dtype=bool) if mask is None else mask
+        self.tiles[mask] = self.start_tiles
+        self.state[mask] = Game.State.Playing
+        self.score[mask] = 0
+        self.dots_eaten[mask] = 0
+        self.ghosts_eaten[mask] = 0
+        self.lives[mask] = 2
+        self.time[mask] = 0
+        self.scared_timer[mask] = 0
+        self.reset_entities(mask)
+
+    def reset_entities(self, mask):
+        self.pac_pos[mask] = self.pac_spawn
+        self.pac_dir[mask] = 0
+        self.pac_queue[mask] = 0
+        self.pac_size[mask] = 1
+        self.ghost_pos[mask] = self.ghost_spawn
+        self.ghost_dest[mask] = self.ghost_spawn
+        self.has_dest[mask] = False
+        self.ghost_state[mask] = chase
+        self.scared_spawn[mask] = False
+
+    def wrap(self, pos):
+        """Board.wrap, rounding the same way"""
+        return np.mod(np.mod(pos, self.size) + self.size, self.size)
+
+    def tile_at(self, pos, env):
+        """Tile codes under float positions, wrapped around the board"""
+        cell = self.wrap(pos).astype(np.intp)
+        return self.tiles[env, cell[..., 1] * self.width + cell[..., 0]]
+
+    def can_move(self, pos, dir):
+        """Vectorized Pacman.can_move_toward"""
+        tile = self.tile_at(np.trunc(pos + dir), self.envs)
+        return (tile != Tile.Wall.value) & (tile != Tile.Gate.value)
+
+    def step(self, action, dt):
+        """Advance every game by dt given one action code per game
+
+        Returns the score gained this step and whether each game is over.
+        """
+        playing = self.state == Game.State.Playing
+        dying = self.state == Game.State.Dying
+        prev_score = self.score.copy()
+
+        self.update_pacman(np.asarray(action), playing, dt)
+        self.update_ghosts(playing, dt)
+
+        # Eat dots
+        cell = self.wrap(self.pac_pos).astype(np.intp)
+        cell = cell[:, 1] * self.width + cell[:, 0]
+        tile = self.tiles[self.envs, cell]
+        dot = playing & (tile == Tile.Dot.value)
+        power = playing & (tile == Tile.Power.value)
+        self.tiles[self.envs[dot | power], cell[dot | power]] = Tile.Empty.value
+        self.score += dot * main.dot_score + power * main.power_score
+        self.dots_eaten += dot | power
+        self.scared_timer[power] = main.scared_duration
+        self.ghost_state[power] = scared
+        self.scared_spawn[power] = False
+
+        # Pac/Ghost collision, in ghost order until the first deadly one
+        dist = np.linalg.norm(self.ghost_pos - self.pac_pos[:, None], axis=2)
+        hit = playing[:, None] & (dist < 0.3)
+        deadly = hit & (self.ghost_state == chase)
+        died = deadly.any(axis=1)
+        first = np.where(died, deadly.argmax(axis=1), self.g)
+        caught = (
+            hit
+            & (self.ghost_state == scared)
+            & (np.arange(self.g)[None] < first[:, None])
+        )
+        streak = self.ghosts_eaten[:, None] + np.cumsum(caught, axis=1)
+        self.score += (caught * main.ghost_mul * 2 ** np.minimum(streak, 4)).sum(1)
+        self.ghosts_eaten += caught.sum(axis=1)
+        self.ghost_state[caught] = eaten
+        self.state[died] = Game.State.Dying
+
+        # Win condition
+        alive = playing & ~died
+        won = alive & (self.dots_eaten == self.max_dots)
+        self.state[won] = Game.State.Win
+        alive &= ~won
+
+        # Timers
+        self.time[alive] += dt
+        self.scared_timer[alive] = np.maximum(0, self.scared_timer[alive] - dt)
+        calm = alive & (self.scared_timer == 0)
+        self.ghost_state[calm[:, None] & (self.ghost_state == scared)] = chase
+
+        # Death animation
+        self.pac_size[dying] = np.maximum(0, self.pac_size[dying] - 0.5 * dt)
+        done = dying & (self.pac_size == 0)
+        self.state[done & (self.lives == 0)] = Game.State.Lose
+        respawn = done & (self.lives > 0)
+        self.lives[respawn] -= 1
+        self.reset_entities(respawn)
+        self.state[respawn] = Game.State.Playing
+
+        over = (self.state == Game.State.Lose) | (self.state == Game.State.Win)
+        return self.score - prev_score, over
+
+    def update_pacman(self, action, playing, dt):
+        new = actions[action]
+        has_new = playing & new.any(axis=1)
+        has_queue = playing & ~has_new & self.pac_queue.any(axis=1)
+        want = np.where(has_new[:, None], new, self.pac_queue)
+        can = self.can_move(self.pac_pos, want)
+
+        # Turning needs Pacman near the center of the cross axis
+        frac = self.pac_pos % 1
+        centered = np.where(
+            want[:, 0] != 0,
+            (frac[:, 1] > 0.4) & (frac[:, 1] < 0.6),
+            (frac[:, 0] > 0.4) & (frac[:, 0] < 0.6),
+        )
+        perpendicular = (self.pac_dir * want).sum(axis=1) == 0
+        reverse = has_new & can & ~perpendicular
+        turn = (has_new & can & perpendicular | has_queue & can) & centered
+        enqueue = has_new & ~(can & perpendicular & centered) & ~reverse
+
+        snapped = np.floor(self.pac_pos) + 0.5
+        snap_y = turn & (want[:, 0] != 0)
+        snap_x = turn & (want[:, 0] == 0)
+        self.pac_pos[snap_y, 1] = snapped[snap_y, 1]
+        self.pac_pos[snap_x, 0] = snapped[snap_x, 0]
+        self.pac_dir[turn | reverse] = want[turn | reverse]
+        self.pac_queue[enqueue] = want[enqueue]
+        self.pac_queue[reverse | has_queue & turn] = 0
+
+        blocked = playing & ~self.can_move(self.pac_pos, self.pac_dir * 0.5)
+        self.pac_dir[blocked] = 0
+        moving = playing & self.pac_dir.any(axis=1)
+        self.pac_pos[moving] = self.wrap(
+            self.pac_pos[moving] + self.pac_dir[moving] * dt * main.speed
+        )
+
+    def update_ghosts(self, playing, dt):
+        active = playing[:, None] & (self.time[:, None] >= self.release[None])
+        state = self.ghost_state
+        speed = main.speed * np.select(
+            [state == eaten, state == scared],
+            [main.eaten_speed_mul, main.scared_speed_mul],
+            1,
+        )
+
+        # Move toward destination
+        moving = active & self.has_dest
+        choosing = active & ~self.has_dest
+        diff = self.ghost_dest - self.ghost_pos
+        dist = np.linalg.norm(diff, axis=2)
+        step = dt * speed
+        arrive = moving & (dist < step)
+        glide = moving & ~arrive & (dist > 0)
+        self.ghost_pos[arrive] = self.wrap(self.ghost_dest[arrive])
+        self.has_dest[arrive] = False
+        home = np.linalg.norm(self.ghost_pos - self.ghost_spawn[None], axis=2) < 0.1
+        state[arrive & (state == eaten) & home] = chase
+        forward = step[..., None] * (diff / np.where(dist > 0, dist, 1)[..., None])
+        self.ghost_pos[glide] += forward[glide]
+
+        # Choose new destination
+        pac = self.pac_pos[:, None]
+        target = np.broadcast_to(pac, self.ghost_pos.shape).copy()
+        kind = self.ghost_id % 4
+
+        # Ghost 1 aims past Pacman, away from ghost 0
+        ts = np.array([2, 1.75, 1.5, 1.25])
+        probes = (
+            self.pac_pos[:, None]
+            + (self.ghost_pos[:, :1] - self.pac_pos[:, None]) * ts[None, :, None]
+        )
+        inside = (
+            (probes[..., 0] >= 0)
+            & (probes[..., 0] < self.width)
+            & (probes[..., 1] >= 0)
+            & (probes[..., 1] < self.height)
+        )
+        cell = np.where(inside[..., None], probes, 0).astype(np.intp)
+        tile = self.tiles[self.envs[:, None], cell[..., 1] * self.width + cell[..., 0]]
+        open_ = inside & (tile != Tile.Wall.value)
+        ahead = np.where(
+            open_.any(axis=1)[:, None],
+            probes[self.envs, open_.argmax(axis=1)],
+            self.pac_pos,
+        )
+        target[:, kind == 1] = ahead[:, None]
+
+        # Ghost 2 aims in front of Pacman
+        lead = self.pac_pos
+        for mul in [1, 2]:
+            lead = np.where(
+                self.can_move(self.pac_pos, mul * self.pac_dir)[:, None],
+                self.pac_pos + mul * self.pac_dir,
+                lead,
+            )
+        target[:, kind == 2] = lead[:, None]
+
+        # Ghost 3 retreats when close
+        near = np.linalg.norm(self.ghost_pos - pac, axis=2) <= 8
+        shy = near & (kind == 3)[None]
+        target[shy] = np.broadcast_to(self.scatters, target.shape)[shy]
+
+        scatter_mode = (self.time**2 % 100) ** 1.2 < 10
+        corner = np.broadcast_to(self.scatters, target.shape)
+        target = np.where(scatter_mode[:, None, None], corner, target)
+        flee = np.where(self.scared_spawn[..., None], self.ghost_spawn[None], corner)
+        flip = choosing & (state == scared)
+        flip &= np.linalg.norm(self.ghost_pos - flee, axis=2) < 1
+        target = np.where((state == scared)[..., None], flee, target)
+        target = np.where((state == eaten)[..., None], self.ghost_spawn[None], target)
+        self.scared_spawn[flip] = ~self.scared_spawn[flip]
+
+        start = self.ghost_pos.astype(np.intp)
+        dest = self.wrap(target).astype(np.intp)
+        a = self.node[start[..., 1] * self.width + start[..., 0]]
+        b = self.node[dest[..., 1] * self.width + dest[..., 0]]
+        routed = choosing & (a >= 0) & (b >= 0)
+        hop = np.where(routed, self.next_hop[b, a], routing.no_route)
+        routed &= hop != routing.no_route
+        self.ghost_dest[routed] = start[routed] + route_dirs[hop[routed]] + 0.5
+        self.has_dest[routed] = True
@@ -0,0 +1,221 @@
+"""Benchmarks for the simulation, pathfinding and rendering hot paths
+
+Results are written as JSON and can be compared against a stored baseline,
+failing when any benchmark gets slower than the allowed tolerance:
+
+    python bench.py --save-baseline
+    python bench.py --compare
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+from pygame import Vector2
+
+from headless import RandomAgent
+from inputs import AgentInput
+from main import Game, tick_rate
+
+baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench.json")
+seed = 1234
+warmup_steps = tick_rate * 5  # Steps played before measuring, to spread things out
+
+
+def timed(fn, calls, repeats):
+    """Best seconds per call of fn over several repeats"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(calls)
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best
+
+
+def playing_game():
+    game = Game(AgentInput(RandomAgent(seed)))
+    game.space()
+    for _ in range(warmup_steps):
+        game.update(1 / tick_rate)
+    return game
+
+
+def bench_ghost_decision(repeats):
+    game = playing_game()
+    ghost = game.ghosts[0]
+    pos = ghost.pos
+
+    def run(calls):
+        for _ in range(calls):
+            ghost.pos = pos
+            ghost.dest = None
+            ghost.path = []  # Plan a route each call, not just follow one
+            ghost.goal = None
+            ghost.update(1 / tick_rate, game.pac, game.ghosts, game.board)
+
+    return timed(run, 10000, repeats) * 1e6, "us/call", False
+
+
+def bench_board_getitem(repeats):
+    board = playing_game().board
+    keys = [
+        Vector2(x + 0.5, y + 0.5)
+        for y in range(board.height)
+        for x in range(board.width)
+    ]
+
+    def run(calls):
+        for _ in range(calls // len(keys)):
+            for key in keys:
+                board[key]
+
+    return 1 / timed(run, len(keys) * 50, repeats), "lookups/s", True
+
+
+def bench_pathable_neighbors(repeats):
+    board = playing_game().board
+    keys = [Vector2(x, y) for y in range(board.height) for x in range(board.width)]
+
+    def run(calls):
+        for _ in range(calls // len(keys)):
+            for key in keys:
+                board.pathable_neighbors(key)
+
+    return 1 / timed(run, len(keys) * 20, repeats), "calls/s", True
+
+
+def bench_headless_steps(repeats):
+    def run(calls):
+        game = Game(AgentInput(RandomAgent(seed)))
+        game.space()
+        for _ in range(calls):
+            if game.state not in (Game.State.Playing, Game.State.Dying):
+                game.space()
+            game.update(1 / tick_rate)
+
+    return 1 / timed(run, tick_rate * 60, repeats), "steps/s", True
+
+
+def bench_crowd_steps(repeats):
+    def run(calls):
+        game = Game(AgentInput(RandomAgent(seed)), crowd=300)
+        game.space()
+        for _ in range(calls):
+            if game.state not in (Game.State.Playing, Game.State.Dying):
+                game.space()
+            game.update(1 / tick_rate)
+
+    return 1 / timed(run, tick_rate * 20, repeats), "steps/s", True
+
+
+def render_frames(full):
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.Surface((1280, 720))
+    game = playing_game()
+
+    def run(calls):
+        for _ in range(calls):
+            # Keep playing, since end screens are drawn once and cached
+            if game.state not in (Game.State.Playing, Game.State.Dying):
+                game.space()
+            game.update(1 / tick_rate)
+            if full and game.layers:
+                game.layers.close()
+                game.layers = None
+            game.render(screen)
+
+    return run
+
+
+def bench_render_full(repeats):
+    return timed(render_frames(True), 30, repeats) * 1e3, "ms/frame", False
+
+
+def bench_render_incremental(repeats):
+    return timed(render_frames(False), 300, repeats) * 1e3, "ms/frame", False
+
+
+benchmarks = {
+    "ghost_decision": bench_ghost_decision,
+    "board_getitem": bench_board_getitem,
+    "pathable_neighbors": bench_pathable_neighbors,
+    "headless_steps": bench_headless_steps,
+    "crowd_steps": bench_crowd_steps,
+    "render_full": bench_render_full,
+    "render_incremental": bench_render_incremental,
+}
+
+
+def run_all(names, repeats):
+    results = {}
+    for name in names:
+        value, unit, higher_is_better = benchmarks[name](repeats)
+        results[name] = {
+            "value": value,
+            "unit": unit,
+            "higher_is_better": higher_is_better,
+        }
+        print(f"{name:<22} {value:>14.3f} {unit}")
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    """Names and descriptions of benchmarks worse than baseline by tolerance"""
+    found = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]["value"]
+        new = result["value"]
+        change = (new - old) / old if old else 0
+        if result["higher_is_better"]:
+            change = -change
+        if change > tolerance:
+            found.append(f"{name}: {old:.3f} -> {new:.3f} {result['unit']}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("names", nargs="*", help="benchmarks to run, default all")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", default=baseline_path)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%"
+    )
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in benchmarks:
+            parser.error(f"unknown benchmark {name}, pick from {', '.join(benchmarks)}")
+
+    results = run_all(args.names or list(benchmarks), args.repeats)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(results, baseline, args.tolerance)
+        if found:
+            print("Regressions against " + args.baseline + ":")
+            for line in found:
+                print("  " + line)
+            sys.exit(1)
+        print("No regressions against " + args.baseline)
+
+
+if __name__ == "__main__":
+    main()
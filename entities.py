@@ -0,0 +1,92 @@
+"""Entity state held in preallocated arrays, Pacman first and then each ghost
+
+Pacman and Ghost objects are views onto one slot each. Their updates read
+and write the arrays as plain floats, so the simulation makes no Vector2
+objects. The pos, prev_pos, dir and dest properties build them for
+drawing and for everything else that wants vectors.
+"""
+
+from array import array
+
+from pygame import Vector2
+
+
+class EntityStore:
+    def __init__(self, count):
+        self.count = count
+        zeros = array("d", bytes(8 * count))
+        self.x = array("d", zeros)  # Position
+        self.y = array("d", zeros)
+        self.prev_x = array("d", zeros)  # Position before the last update
+        self.prev_y = array("d", zeros)
+        self.dir_x = array("d", zeros)  # Direction of travel, for Pacman
+        self.dir_y = array("d", zeros)
+        self.dest_x = array("d", zeros)  # Tile center a ghost is heading to
+        self.dest_y = array("d", zeros)
+        self.moving = bytearray(count)  # Whether dest is set
+        self.state = bytearray(count)  # Ghost.State values
+        self.scared_spawn = bytearray(count)  # Scared ghost heading home, not out
+
+    def copy(self):
+        store = EntityStore.__new__(EntityStore)
+        store.count = self.count
+        store.x = self.x[:]
+        store.y = self.y[:]
+        store.prev_x = self.prev_x[:]
+        store.prev_y = self.prev_y[:]
+        store.dir_x = self.dir_x[:]
+        store.dir_y = self.dir_y[:]
+        store.dest_x = self.dest_x[:]
+        store.dest_y = self.dest_y[:]
+        store.moving = self.moving[:]
+        store.state = self.state[:]
+        store.scared_spawn = self.scared_spawn[:]
+        return store
+
+    def snapshot(self):
+        """Copies of the columns restore needs, everything but prev_x, prev_y"""
+        return (
+            self.x[:],
+            self.y[:],
+            self.dir_x[:],
+            self.dir_y[:],
+            self.dest_x[:],
+            self.dest_y[:],
+            self.moving[:],
+            self.state[:],
+            self.scared_spawn[:],
+        )
+
+    def restore(self, columns):
+        """Copy columns from snapshot back in, with no movement to draw"""
+        (
+            self.x[:],
+            self.y[:],
+            self.dir_x[:],
+            self.dir_y[:],
+            self.dest_x[:],
+            self.dest_y[:],
+            self.moving[:],
+            self.state[:],
+            self.scared_spawn[:],
+        ) = columns
+        self.remember()
+
+    def remember(self):
+        """Keep the current positions as the previous ones, for drawing"""
+        self.prev_x[:] = self.x
+        self.prev_y[:] = self.y
+
+
+def vector(xs, ys):
+    """Vector2 property stored in two of the store's arrays at the view's slot"""
+
+    def get(view):
+        i = view.index
+        return Vector2(getattr(view.store, xs)[i], getattr(view.store, ys)[i])
+
+    def set(view, value):
+        i = view.index
+        getattr(view.store, xs)[i], getattr(view.store, ys)[i] = value
+
+    return property(get, set)
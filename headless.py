@@ -0,0 +1,141 @@
+"""Run games without a window, as fast as the CPU allows"""
+
+import argparse
+import os
+import random
+import time
+from collections import deque
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from pygame import Vector2
+
+from inputs import AgentInput
+from main import Game, Ghost, Tile, mask_dirs, tick_rate
+from maze import open_maze
+from telemetry import telemetry
+
+step_dt = 1 / tick_rate  # Simulated seconds per update
+max_steps = tick_rate * 60 * 10  # Give up on a game after ten simulated minutes
+
+
+class RandomAgent:
+    """Wander the maze, picking a new open direction every so often"""
+
+    choices = [Vector2(0, -1), Vector2(0, 1), Vector2(-1, 0), Vector2(1, 0)]
+
+    def __init__(self, seed=None, turn_every=30):
+        self.rng = random.Random(seed)
+        self.turn_every = turn_every
+        self.dir = Vector2(0)
+        self.tick = 0
+
+    def __call__(self, game):
+        if self.tick % self.turn_every == 0 or not game.pac.can_move_toward(
+            self.dir, game.board
+        ):
+            open_dirs = [
+                d
+                for d in self.choices
+                if game.pac.can_move_toward(d, game.board) and d != -self.dir
+            ]
+            self.dir = self.rng.choice(open_dirs or [-self.dir])
+        self.tick += 1
+        return self.dir
+
+
+class GreedyAgent:
+    """Head for the nearest dot, steering clear of ghosts that can kill"""
+
+    def __init__(self, seed=None, caution=3):
+        self.rng = random.Random(seed)
+        self.caution = caution  # Tiles around a chasing ghost to avoid
+        self.tile = None
+        self.dir = Vector2(0)
+
+    def __call__(self, game):
+        board = game.board
+        pac = game.pac
+        tile = (int(pac.pos.x), int(pac.pos.y))
+        if tile == self.tile and pac.can_move_toward(self.dir, board):
+            return self.dir
+        self.tile = tile
+
+        # Tiles too close to a chasing ghost
+        danger = set()
+        for ghost in game.ghosts:
+            if ghost.state != Ghost.State.ChaseScatter:
+                continue
+            gx, gy = int(ghost.pos.x), int(ghost.pos.y)
+            for dy in range(-self.caution, self.caution + 1):
+                reach = self.caution - abs(dy)
+                for dx in range(-reach, reach + 1):
+                    danger.add(((gx + dx) % board.width, (gy + dy) % board.height))
+
+        # Breadth-first search for the nearest dot, remembering the first step
+        first = {tile: None}
+        queue = deque([tile])
+        while queue:
+            x, y = queue.popleft()
+            if board.get(x, y) in (Tile.Dot, Tile.Power) and first[(x, y)]:
+                self.dir = Vector2(first[(x, y)])
+                return self.dir
+            for dx, dy in mask_dirs[board.masks[y * board.width + x]]:
+                next = ((x + dx) % board.width, (y + dy) % board.height)
+                if next in first or next in danger or board.get(*next) == Tile.Gate:
+                    continue
+                first[next] = first[(x, y)] or (dx, dy)
+                queue.append(next)
+
+        # Nowhere safe to go, so keep moving
+        open_dirs = [d for d in RandomAgent.choices if pac.can_move_toward(d, board)]
+        stuck = self.dir.length() == 0 or not pac.can_move_toward(self.dir, board)
+        if open_dirs and stuck:
+            self.dir = self.rng.choice(open_dirs)
+        return self.dir
+
+
+agents = {"random": RandomAgent, "greedy": GreedyAgent}
+
+
+def run(game, dt=step_dt, steps=max_steps):
+    """Start a game and step it until it is won, lost, or out of steps"""
+    game.space()
+    for step in range(steps):
+        if game.state not in (Game.State.Playing, Game.State.Dying):
+            return step
+        game.update(dt)
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--steps", type=int, default=max_steps)
+    parser.add_argument("--agent", choices=agents, default="random")
+    parser.add_argument("--maze", help="maze file, or WIDTHxHEIGHT to generate one")
+    parser.add_argument("--crowd", type=int, default=0, help="extra ghosts to add")
+    parser.add_argument(
+        "--telemetry", metavar="DIR", help="record game events, see telemetry.py"
+    )
+    args = parser.parse_args()
+    if args.telemetry:
+        telemetry.open(args.telemetry)
+    maze = args.maze and open_maze(args.maze, args.seed)
+
+    total_steps = 0
+    start = time.perf_counter()
+    for i in range(args.games):
+        game = Game(AgentInput(agents[args.agent](args.seed + i)), maze, args.crowd)
+        total_steps += run(game, steps=args.steps)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{args.games} games, {total_steps} steps in {elapsed:.2f}s "
+        f"({total_steps / elapsed:.0f} steps/s, "
+        f"{args.games / elapsed * 60:.0f} games/min)"
+    )
+
+
+if __name__ == "__main__":
+    main()
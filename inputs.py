@@ -0,0 +1,52 @@
+"""Input providers that tell Pacman which way to go each update"""
+
+import pygame
+from pygame import Vector2
+
+
+class IdleInput:
+    def direction(self, game):
+        return Vector2(0)
+
+
+class KeyboardInput:
+    def direction(self, game):
+        keys = pygame.key.get_pressed()
+        new_dir = Vector2(0)
+        if keys[pygame.K_w] or keys[pygame.K_UP]:
+            new_dir.y -= 1
+        if keys[pygame.K_s] or keys[pygame.K_DOWN]:
+            new_dir.y += 1
+        if keys[pygame.K_a] or keys[pygame.K_LEFT]:
+            new_dir.x -= 1
+        if keys[pygame.K_d] or keys[pygame.K_RIGHT]:
+            new_dir.x += 1
+        if new_dir.x != 0:
+            new_dir.y = 0
+        return new_dir
+
+
+class ScriptedInput:
+    """Play back a fixed sequence of directions, one per update"""
+
+    def __init__(self, dirs, loop=False):
+        self.dirs = [Vector2(d) for d in dirs]
+        self.loop = loop
+        self.tick = 0
+
+    def direction(self, game):
+        if not self.dirs or (self.tick >= len(self.dirs) and not self.loop):
+            return Vector2(0)
+        dir = self.dirs[self.tick % len(self.dirs)]
+        self.tick += 1
+        return Vector2(dir)
+
+
+class AgentInput:
+    """Ask a callable agent for a direction given the current game"""
+
+    def __init__(self, agent):
+        self.agent = agent
+
+    def direction(self, game):
+        return Vector2(self.agent(game))
@@ -1,9 +1,28 @@
+from time import perf_counter
+
+import_started = perf_counter()  # For the startup report
+
+import argparse
+import os
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
 import pygame
 from pygame import Vector2
 from enum import Enum
-from math import floor, sqrt, sin, tau
-from astar import find_path
-
+from collections import OrderedDict
+from math import ceil, floor, sin, sqrt, tau
+import routing
+from maze import Maze, build_masks, open_maze
+from inputs import IdleInput, KeyboardInput
+from textcache import TextCache
+from timestep import FixedTimestep, FramePacer
+from profiler import StartupTimer, profiler
+from spatial import SpatialHash
+from entities import EntityStore, vector
+from planner import Planner, plan
+import telemetry as events
+from telemetry import telemetry
 
 # Constants
 speed = 4  # Default speed of pacman and ghosts
@@ -14,12 +33,22 @@ scared_duration = 8  # Duration that ghosts are scared after eating a pellet
 eaten_speed_mul = 1.8  # Ghost speed multiplier after being eaten
 scared_speed_mul = 0.7  # Ghost speed multiplier when scared
 top_size = 2  # Cell size of top text bar
+tick_rate = 120  # Simulation steps per second
+max_catch_up = 8  # Most simulation steps run for a single frame
+min_tile = 16  # Smallest tile size in pixels, below which the camera scrolls
 
 
 def lerp(a, b, t):
     return a + (b - a) * t
 
 
+def interpolate(prev, pos, alpha):
+    """Position between the last two steps, without sliding across a wrap"""
+    if alpha >= 1 or prev.distance_squared_to(pos) > 1:
+        return pos
+    return lerp(prev, pos, alpha)
+
+
 class Tile(Enum):
     Empty = 0
     Wall = 1
@@ -61,25 +90,126 @@ board_spec = [
 ]
 
 
-def floor_pos(pos: Vector2):
-    return Vector2(int(pos.x), int(pos.y))
+def default_maze():
+    """The arcade maze, parsed once per process"""
+    if "default" not in mazes:
+        mazes["default"] = Maze.parse(board_spec)
+    return mazes["default"]
+
+
+mazes = {}
+
+
+tile_codes = list(Tile)  # Tile by value, for decoding Board.cells
+wall = Tile.Wall.value
+gate = Tile.Gate.value
+
+# Directions present in each neighbor mask, in routing.dirs bit order
+mask_dirs = [
+    [d for bit, d in enumerate(routing.dirs) if mask & 1 << bit] for mask in range(16)
+]
 
 
 class Board:
+    __slots__ = (
+        "cells",
+        "shared",
+        "masks",
+        "time",
+        "max_dots",
+        "width",
+        "height",
+        "routes",
+        "flows",
+        "listeners",
+    )
 
     def __init__(self):
-        self.tiles = []
+        self.cells = bytearray()  # Tile values, row by row
+        self.shared = False  # Whether cells must be copied before writing
+        self.masks = bytearray()  # Non-wall neighbors of each tile, wrapping
         self.time = 0
         self.max_dots = 0
         self.width = 0
         self.height = 0
+        self.routes = None
+        self.flows = None  # Distance fields toward shared targets, in crowd mode
+        self.listeners = []  # Called with (x, y, tile) when a tile changes
+
+    @property
+    def tiles(self):
+        """Rows of Tile, decoded from the compact cells"""
+        return [
+            [tile_codes[c] for c in self.cells[j * self.width : (j + 1) * self.width]]
+            for j in range(self.height)
+        ]
+
+    def copy(self):
+        """Copy of the board, sharing cells until either side writes"""
+        board = Board.__new__(Board)
+        board.cells = self.cells
+        board.shared = self.shared = True
+        board.masks = self.masks
+        board.time = self.time
+        board.max_dots = self.max_dots
+        board.width = self.width
+        board.height = self.height
+        board.routes = self.routes
+        board.flows = self.flows
+        board.listeners = []
+        return board
+
+    def build_masks(self):
+        self.masks = build_masks(self.width, self.height, self.cells)
+
+    def update_mask(self, x, y):
+        mask = 0
+        for bit, (dx, dy) in enumerate(routing.dirs):
+            nx = (x + dx) % self.width
+            ny = (y + dy) % self.height
+            if self.cells[ny * self.width + nx] != wall:
+                mask |= 1 << bit
+        self.masks[y * self.width + x] = mask
+
+    def get(self, x, y):
+        """Tile at integer coordinates, or None outside the board"""
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            return None
+        return tile_codes[self.cells[y * self.width + x]]
+
+    def wrapped(self, x, y):
+        """Tile at integer coordinates, wrapping around the board"""
+        return tile_codes[self.cells[y % self.height * self.width + x % self.width]]
+
+    def set(self, x, y, val):
+        x %= self.width
+        y %= self.height
+        i = y * self.width + x
+        if self.shared:
+            self.cells = bytearray(self.cells)
+            self.shared = False
+        walls_changed = (self.cells[i] == wall) != (val == Tile.Wall)
+        self.cells[i] = val.value
+        if walls_changed:
+            self.masks = bytearray(self.masks)
+            for dx, dy in routing.dirs:
+                self.update_mask((x + dx) % self.width, (y + dy) % self.height)
+        for listener in self.listeners:
+            listener(x, y, val)
+
+    def neighbors(self, x, y):
+        """Non-wall neighbors of a tile at integer coordinates, wrapping"""
+        return [
+            ((x + dx) % self.width, (y + dy) % self.height)
+            for dx, dy in mask_dirs[self.masks[y * self.width + x]]
+        ]
 
     def __getitem__(self, key):
         if key.x < 0 or key.x >= self.width:
             return None
         if key.y < 0 or key.y >= self.height:
             return None
-        return self.tiles[int(key.y)][int(key.x)]
+        return tile_codes[self.cells[int(key.y) * self.width + int(key.x)]]
 
     def scatter(self):
         return (self.time**2 % 100) ** 1.2 < 10
@@ -92,106 +222,140 @@ class Board:
 
     def get_wrapped(self, key):
         key = self.wrap(key)
-        return self.tiles[int(key.y)][int(key.x)]
+        return self.wrapped(int(key.x), int(key.y))
 
     def set_wrapped(self, key, val):
         key = self.wrap(key)
-        self.tiles[int(key.y)][int(key.x)] = val
+        self.set(int(key.x), int(key.y), val)
 
     def pathable_neighbors(self, start: Vector2):
-        start = floor_pos(start)
-        pathable = []
-        for x, y in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
-            dir = Vector2(x, y)
-            tile = self[start + dir]
-            if tile and tile != Tile.Wall:
-                pathable.append(start + dir)
-        return pathable
+        return [Vector2(pos) for pos in self.neighbors(int(start.x), int(start.y))]
+
+
+def passable(board, x, y):
+    """Whether Pacman can enter the tile holding a point, wrapping"""
+    tile = board.cells[int(y) % board.height * board.width + int(x) % board.width]
+    return tile != wall and tile != gate
+
+
+corners = {}  # Scatter corners of each board size
+
+
+def scatter_corners(width, height):
+    if (width, height) not in corners:
+        corners[width, height] = (
+            (width - 2, 1),
+            (width - 2, height - 2),
+            (1, 1),
+            (1, height - 2),
+        )
+    return corners[width, height]
 
 
 class Pacman:
-    def __init__(self, spawn):
+    """View of Pacman's slot in an EntityStore"""
+
+    __slots__ = ("store", "index", "spawn", "queue", "size", "anim_timer")
+
+    pos = vector("x", "y")
+    prev_pos = vector("prev_x", "prev_y")
+    dir = vector("dir_x", "dir_y")
+
+    def __init__(self, spawn, store=None, index=0):
+        self.store = store or EntityStore(1)
+        self.index = index
         self.spawn = spawn
         self.reset()
 
     def reset(self):
-        self.pos = self.spawn
-        self.dir = Vector2(0)
-        self.queue = None
+        self.pos = self.prev_pos = self.spawn
+        self.dir = (0, 0)
+        self.queue = None  # Direction to turn when possible, as a pair
         self.size = 1
         self.anim_timer = 0
 
-    def render(self, screen, offset, scale):
+    def copy(self, store):
+        """The same Pacman viewed in a copy of its store"""
+        pac = Pacman.__new__(Pacman)
+        pac.store = store
+        pac.index = self.index
+        pac.spawn = self.spawn
+        pac.queue = self.queue
+        pac.size = self.size
+        pac.anim_timer = self.anim_timer
+        return pac
+
+    def sprite(self, atlas, offset, scale, alpha=1):
+        """Surface and screen position to blit Pacman at"""
         size = min(self.size, 1 - 0.15 * (sin(self.anim_timer * tau * 4) / 2 + 1))
-        pygame.draw.circle(
-            screen,
-            (255, 255, 0),
-            offset + self.pos * scale,
-            scale / 2 * size,
-        )
+        pos = interpolate(self.prev_pos, self.pos, alpha)
+        return atlas.pacman(size), offset + pos * scale - atlas.anchor
 
     def can_move_toward(self, dir, board):
-        target_tile = board.get_wrapped(floor_pos(self.pos + dir))
-        return target_tile != Tile.Wall and target_tile != Tile.Gate
-
-    def update(self, dt, board):
-        # Get intended direction
-        keys = pygame.key.get_pressed()
-        new_dir = Vector2(0)
-        if keys[pygame.K_w] or keys[pygame.K_UP]:
-            new_dir.y -= 1
-        if keys[pygame.K_s] or keys[pygame.K_DOWN]:
-            new_dir.y += 1
-        if keys[pygame.K_a] or keys[pygame.K_LEFT]:
-            new_dir.x -= 1
-        if keys[pygame.K_d] or keys[pygame.K_RIGHT]:
-            new_dir.x += 1
-        if new_dir.x != 0:
-            new_dir.y = 0
+        i = self.index
+        return passable(board, self.store.x[i] + dir[0], self.store.y[i] + dir[1])
+
+    def update(self, dt, board, new_dir):
+        store = self.store
+        i = self.index
+        x = store.x[i]
+        y = store.y[i]
+        dx = store.dir_x[i]
+        dy = store.dir_y[i]
+        nx, ny = new_dir
 
         # Set direction
-        if new_dir.length() > 0:
-            if self.can_move_toward(new_dir, board):
-                if self.dir.dot(new_dir) == 0:
-                    if new_dir.x != 0:
-                        if self.pos.y % 1 > 0.4 and self.pos.y % 1 < 0.6:
-                            self.pos.y = floor(self.pos.y) + 0.5
-                            self.dir = new_dir
+        if nx or ny:
+            if passable(board, x + nx, y + ny):
+                if dx * nx + dy * ny == 0:
+                    if nx != 0:
+                        if y % 1 > 0.4 and y % 1 < 0.6:
+                            y = floor(y) + 0.5
+                            dx, dy = nx, ny
                         else:
-                            self.queue = new_dir
-                    elif new_dir.y != 0:
-                        if self.pos.x % 1 > 0.4 and self.pos.x % 1 < 0.6:
-                            self.pos.x = floor(self.pos.x) + 0.5
-                            self.dir = new_dir
+                            self.queue = (nx, ny)
+                    elif ny != 0:
+                        if x % 1 > 0.4 and x % 1 < 0.6:
+                            x = floor(x) + 0.5
+                            dx, dy = nx, ny
                         else:
-                            self.queue = new_dir
+                            self.queue = (nx, ny)
                 else:
-                    self.dir = new_dir
+                    dx, dy = nx, ny
                     self.queue = None
             else:
-                self.queue = new_dir
-        elif self.queue and self.can_move_toward(self.queue, board):
-            if self.queue.x != 0:
-                if self.pos.y % 1 > 0.4 and self.pos.y % 1 < 0.6:
-                    self.pos.y = floor(self.pos.y) + 0.5
-                    self.dir = self.queue
+                self.queue = (nx, ny)
+        elif self.queue and passable(board, x + self.queue[0], y + self.queue[1]):
+            qx, qy = self.queue
+            if qx != 0:
+                if y % 1 > 0.4 and y % 1 < 0.6:
+                    y = floor(y) + 0.5
+                    dx, dy = qx, qy
                     self.queue = None
-            elif self.queue.y != 0:
-                if self.pos.x % 1 > 0.4 and self.pos.x % 1 < 0.6:
-                    self.pos.x = floor(self.pos.x) + 0.5
-                    self.dir = self.queue
+            elif qy != 0:
+                if x % 1 > 0.4 and x % 1 < 0.6:
+                    x = floor(x) + 0.5
+                    dx, dy = qx, qy
                     self.queue = None
-        if not self.can_move_toward(self.dir * 0.5, board):
-            self.dir = Vector2(0)
+        if not passable(board, x + dx * 0.5, y + dy * 0.5):
+            dx = dy = 0
 
         # Update position
-        if self.dir.length() > 0:
+        if dx or dy:
             self.anim_timer += dt
-            self.pos += self.dir * dt * speed
-            self.pos = board.wrap(self.pos)
+            x = x + dx * dt * speed
+            y = y + dy * dt * speed
+            x = (x % board.width + board.width) % board.width
+            y = (y % board.height + board.height) % board.height
+        store.x[i] = x
+        store.y[i] = y
+        store.dir_x[i] = dx
+        store.dir_y[i] = dy
 
 
 class Ghost:
+    """View of a ghost's slot in an EntityStore"""
+
     class State(Enum):
         ChaseScatter = 0
         Scared = 1
@@ -199,125 +363,234 @@ class Ghost:
 
     colors = [(255, 0, 0), (0, 255, 255), (255, 128, 255), (255, 128, 0)]
 
-    def __init__(self, id, spawn: Vector2):
+    __slots__ = ("store", "index", "id", "spawn", "path", "goal")
+
+    pos = vector("x", "y")
+    prev_pos = vector("prev_x", "prev_y")
+
+    def __init__(self, id, spawn: Vector2, store=None, index=0):
+        self.store = store or EntityStore(1)
+        self.index = index
         self.id = id
         self.spawn: Vector2 = spawn
         self.reset()
 
+    @property
+    def dest(self):
+        """Center of the tile being moved to, or None while deciding"""
+        i = self.index
+        if not self.store.moving[i]:
+            return None
+        return Vector2(self.store.dest_x[i], self.store.dest_y[i])
+
+    @dest.setter
+    def dest(self, dest):
+        i = self.index
+        self.store.moving[i] = dest is not None
+        if dest is not None:
+            self.store.dest_x[i], self.store.dest_y[i] = dest
+
+    @property
+    def state(self):
+        return ghost_states[self.store.state[self.index]]
+
+    @state.setter
+    def state(self, state):
+        self.store.state[self.index] = state.value
+
+    @property
+    def scared_spawn(self):
+        """Whether a scared ghost is heading home rather than to its corner"""
+        return bool(self.store.scared_spawn[self.index])
+
+    @scared_spawn.setter
+    def scared_spawn(self, scared_spawn):
+        self.store.scared_spawn[self.index] = scared_spawn
+
     def reset(self):
-        self.pos: Vector2 = self.spawn
+        self.pos = self.prev_pos = self.spawn
         self.dest = None
         self.state = Ghost.State.ChaseScatter
         self.scared_spawn = False
-
-    def update(self, dt, pac: Pacman, ghosts, board: Board):
+        self.path = []  # Steps toward goal, nearest last
+        self.goal = None  # (tile, shared) the path was planned for
+
+    @staticmethod
+    def copy_all(ghosts, store):
+        """The same ghosts viewed in a copy of their store"""
+        new = Ghost.__new__
+        copies = []
+        for old in ghosts:
+            ghost = new(Ghost)
+            ghost.store = store
+            ghost.index = old.index
+            ghost.id = old.id
+            ghost.spawn = old.spawn
+            ghost.path = old.path[:]
+            ghost.goal = old.goal
+            copies.append(ghost)
+        return copies
+
+    def update(self, dt, pac: Pacman, ghosts, board: Board, planner=None):
+        """Move or pick the next tile, returning True on reaching a tile
+
+        Paths are planned right away, or left to planner if given.
+        """
         if board.time < self.id * 0.1:
             return
+        store = self.store
+        i = self.index
+        state = store.state[i]
         speed_mul = speed * (
             eaten_speed_mul
-            if self.state == Ghost.State.Eaten
-            else scared_speed_mul if self.state == Ghost.State.Scared else 1
+            if state == eaten
+            else scared_speed_mul if state == scared else 1
         )
-        if self.dest:
+        x = store.x[i]
+        y = store.y[i]
+        if store.moving[i]:
             # Move toward destination
-            diff = self.dest - self.pos
-            if diff.length() < dt * speed_mul:
-                self.pos = self.dest
-                self.dest = None
-                if (
-                    self.state == Ghost.State.Eaten
-                    and (self.pos - self.spawn).length() < 0.1
-                ):
-                    self.state = Ghost.State.ChaseScatter
-            elif diff.length() > 0:
-                self.pos = self.pos + dt * speed_mul * diff.normalize()
+            dx = store.dest_x[i] - x
+            dy = store.dest_y[i] - y
+            length = sqrt(dx * dx + dy * dy)
+            if length < dt * speed_mul:
+                width = board.width
+                height = board.height
+                x = store.x[i] = (store.dest_x[i] % width + width) % width
+                y = store.y[i] = (store.dest_y[i] % height + height) % height
+                store.moving[i] = False
+                if state == eaten:
+                    dx = x - self.spawn.x
+                    dy = y - self.spawn.y
+                    if sqrt(dx * dx + dy * dy) < 0.1:
+                        store.state[i] = chase
+                return True
+            elif length > 0:
+                step = dt * speed_mul
+                store.x[i] = x + step * (dx / length)
+                store.y[i] = y + step * (dy / length)
         else:
             # Choose new destination
-            start = (int(self.pos.x), int(self.pos.y))
-            scatters = dest = [
-                Vector2(board.width - 2, 1),
-                Vector2(board.width - 2, board.height - 2),
-                Vector2(1, 1),
-                Vector2(1, board.height - 2),
-            ]
-            match self.state:
-                case Ghost.State.ChaseScatter:
-                    if board.scatter():
-                        dest = scatters[self.id % 4]
-                    else:
-                        match self.id % 4:
-                            case 0:
-                                dest = pac.pos
-                            case 1:
-                                for t in [2, 1.75, 1.5, 1.25]:
-                                    new = lerp(pac.pos, ghosts[0].pos, t)
-                                    if board[new] and board[new] != Tile.Wall:
-                                        dest = new
-                                        break
-                                else:
-                                    dest = pac.pos
-                            case 2:
-                                for mul in [2, 1]:
-                                    if pac.can_move_toward(mul * pac.dir, board):
-                                        dest = pac.pos + mul * pac.dir
-                                        break
-                                else:
-                                    dest = pac.pos
-                            case 3:
-                                if (self.pos - pac.pos).length() <= 8:
-                                    dest = scatters[3]
-                                else:
-                                    dest = pac.pos
-                case Ghost.State.Scared:
-                    dest = self.spawn if self.scared_spawn else scatters[self.id % 4]
-                    if self.pos.distance_to(dest) < 1:
-                        self.scared_spawn = not self.scared_spawn
-                case Ghost.State.Eaten:
-                    dest = self.spawn
-            dest = (int(dest.x), int(dest.y))
-            path = find_path(
-                start,
-                dest,
-                lambda pos: [
-                    (v[0], v[1])
-                    for v in board.pathable_neighbors(Vector2(pos[0], pos[1]))
-                ],
-                heuristic_cost_estimate_fnct=lambda a, b: sqrt(
-                    (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2
-                ),
-            )
-            path = [x for x in path] if path else []
-            if len(path) >= 2:
-                self.dest = Vector2(path[1][0], path[1][1]) + Vector2(0.5)
-
-    def render(self, screen, offset, scale, scared_timer):
-        color = (
-            Ghost.colors[self.id]
-            if self.state == Ghost.State.ChaseScatter
-            else (
-                (0, 0, 255)
-                if self.state == Ghost.State.Scared
-                and (scared_timer > 2 or scared_timer % 0.4 < 0.2)
-                else (255, 255, 255)
-            )
-        )
-        if self.state == Ghost.State.Eaten:
-            tl = offset + (self.pos - Vector2(0.5)) * scale + Vector2(0, scale * 0.4)
-            size = Vector2(scale, scale * 0.2)
-        else:
-            tl = (
-                offset
-                + (self.pos - Vector2(0.5, 0.1)) * scale
-                + Vector2(scale * 0.1, 0)
-            )
-            size = Vector2(scale * 0.8, scale * 0.6)
-            pygame.draw.circle(
-                screen,
-                color,
-                offset + (self.pos - Vector2(0.01, 0.1)) * scale,
-                0.4 * scale,
-            )
-        pygame.draw.rect(screen, color, (tl, size))
+            started = profiler.start()
+            start = (int(x), int(y))
+            scatters = scatter_corners(board.width, board.height)
+            p = pac.index
+            px = store.x[p]
+            py = store.y[p]
+            shared = True  # Whether the target is one many ghosts share
+            if state == chase:
+                if board.scatter():
+                    tx, ty = scatters[self.id % 4]
+                else:
+                    tx, ty = px, py
+                    match self.id % 4:
+                        case 1:
+                            g = ghosts[0].index
+                            gx = store.x[g]
+                            gy = store.y[g]
+                            for t in [2, 1.75, 1.5, 1.25]:
+                                nx = px + (gx - px) * t
+                                ny = py + (gy - py) * t
+                                if (
+                                    0 <= nx < board.width
+                                    and 0 <= ny < board.height
+                                    and board.cells[int(ny) * board.width + int(nx)]
+                                    != wall
+                                ):
+                                    tx, ty = nx, ny
+                                    shared = False
+                                    break
+                        case 2:
+                            pdx = store.dir_x[p]
+                            pdy = store.dir_y[p]
+                            for mul in [2, 1]:
+                                if passable(board, px + mul * pdx, py + mul * pdy):
+                                    tx = px + mul * pdx
+                                    ty = py + mul * pdy
+                                    shared = False
+                                    break
+                        case 3:
+                            dx = x - px
+                            dy = y - py
+                            if sqrt(dx * dx + dy * dy) <= 8:
+                                tx, ty = scatters[3]
+            elif state == scared:
+                if store.scared_spawn[i]:
+                    tx, ty = self.spawn
+                else:
+                    tx, ty = scatters[self.id % 4]
+                dx = x - tx
+                dy = y - ty
+                if sqrt(dx * dx + dy * dy) < 1:
+                    store.scared_spawn[i] = not store.scared_spawn[i]
+            else:
+                tx, ty = self.spawn
+            shared = shared or (tx, ty) in scatters
+            tx = (tx % board.width + board.width) % board.width
+            ty = (ty % board.height + board.height) % board.height
+            goal = ((int(tx), int(ty)), shared)
+            started = profiler.lap("ghost.target", started)
+            if goal == self.goal and self.path:
+                # A path planned for a goal since given up would start from
+                # a tile this one no longer leads to
+                if planner:
+                    planner.cancel(self)
+                step = self.path.pop()
+            elif planner:
+                # Keep to the old path while a new one is planned from where
+                # it leads
+                step = self.path.pop() if self.path else None
+                after = start
+                if step:
+                    after = (
+                        (start[0] + step[0]) % board.width,
+                        (start[1] + step[1]) % board.height,
+                    )
+                distance = (x - px) * (x - px) + (y - py) * (y - py)
+                planner.request(self, after, goal, distance)
+            else:
+                self.path = plan(board, start, goal)
+                self.goal = goal
+                step = self.path.pop() if self.path else None
+            if step:
+                store.dest_x[i] = start[0] + step[0] + 0.5
+                store.dest_y[i] = start[1] + step[1] + 0.5
+                store.moving[i] = True
+            profiler.lap("ghost.route", started)
+
+    def sprite(self, atlas, offset, scale, scared_timer, alpha=1):
+        """Surface and screen position to blit the ghost at"""
+        pos = interpolate(self.prev_pos, self.pos, alpha)
+        match self.state:
+            case Ghost.State.ChaseScatter:
+                body = atlas.ghost(Ghost.colors[self.id % len(Ghost.colors)])
+            case Ghost.State.Scared if scared_timer > 2 or scared_timer % 0.4 < 0.2:
+                body = atlas.ghost((0, 0, 255))
+            case Ghost.State.Scared:
+                body = atlas.ghost((255, 255, 255))
+            case Ghost.State.Eaten:
+                body = atlas.eyes
+        return body, offset + pos * scale - atlas.anchor
+
+
+ghost_states = list(Ghost.State)  # Ghost.State by value
+chase = Ghost.State.ChaseScatter.value
+scared = Ghost.State.Scared.value
+eaten = Ghost.State.Eaten.value
+
+
+# Fields of a game that its clones start over with, besides fresh lists
+not_cloned = {
+    "layers": None,
+    "chunks": None,
+    "observation": None,
+    "session": None,
+    "top_bar": None,
+    "top_rect": None,
+    "still": None,
+    "still_key": None,
+    "still_shown": False,
+}
 
 
 class Game:
@@ -328,215 +601,686 @@ class Game:
         Lose = 3
         Win = 4
 
-    def __init__(self):
+    def __init__(self, input=None, maze=None, crowd=0, plan_budget=None):
         self.state = Game.State.Start
+        self.input = input or IdleInput()
+        self.maze = maze or default_maze()
         self.board = Board()
-        self.board.height = len(board_spec)
-        self.board.width = len(board_spec[0])
-        self.ghosts: list[Ghost] = []
+        self.board.width = self.maze.width
+        self.board.height = self.maze.height
+        self.board.cells = self.maze.cells
+        self.board.shared = True
+        self.board.masks = self.maze.masks
+        self.board.max_dots = self.maze.max_dots
+        self.board.routes = self.maze.routes()
+
+        # Crowd mode adds ghosts to the house in turn, routed by shared fields
+        spawns = [Vector2(spawn) + Vector2(0.5) for spawn in self.maze.ghosts]
+        count = len(spawns) + crowd
+        self.entities = EntityStore(1 + count)
+        self.pac = Pacman(Vector2(self.maze.pac) + Vector2(0.5), self.entities)
+        self.ghosts = [
+            Ghost(id, spawns[id % len(spawns)], self.entities, 1 + id)
+            for id in range(count)
+        ]
+        self.crowd = crowd
+        self.grid = None
+        if crowd:
+            self.board.flows = routing.FlowFields(
+                self.maze.width, self.maze.height, self.maze.walkable()
+            )
+            self.grid = SpatialHash(self.ghosts)
+
+        # Without a budget, ghosts plan as soon as they decide, which keeps
+        # games reproducible for replays
+        self.planner = None if plan_budget is None else Planner(plan_budget)
         self.score = 0
         self.scared_timer = 0
         self.dots_eaten = 0
         self.ghosts_eaten = 0
         self.lives = 2
-        for j, line in enumerate(board_spec):
-            row = []
-            for i, c in enumerate(line):
-                match c:
-                    case "X":
-                        row.append(Tile.Wall)
-                    case " ":
-                        row.append(Tile.Empty)
-                    case ".":
-                        row.append(Tile.Dot)
-                        self.board.max_dots += 1
-                    case "o":
-                        row.append(Tile.Power)
-                        self.board.max_dots += 1
-                    case "-":
-                        row.append(Tile.Gate)
-                    case "1" | "2" | "3" | "4":
-                        row.append(Tile.Empty)
-                        id = "1234".index(c)
-                        while len(self.ghosts) <= id:
-                            self.ghosts.append(Ghost(0, Vector2()))
-                        self.ghosts[id] = Ghost(id, Vector2(i, j) + Vector2(0.5))
-                    case "S":
-                        row.append(Tile.Empty)
-                        self.pac = Pacman(Vector2(i, j) + Vector2(0.5))
-            self.board.tiles.append(row)
+        self.layers = None
+        self.chunks = None
+        self.atlas = None
+        self.observation = None
+        self.session = None  # Telemetry game id, while recording
+        self.phase = False  # Whether ghosts were scattering, for telemetry
+        self.entity_rects = []
+        self.top_bar = None
+        self.top_rect = None
+        self.overlay = []  # Lines of text drawn over the top bar
+        self.overlay_rects = []
+        self.still = None  # Composed Start, Lose or Win screen
+        self.still_key = None  # What the still screen shows
+        self.still_shown = False  # Whether the screen still holds it
+
+    def snapshot(self):
+        """Capture the mutable state of the game, for restore
+
+        Entities are copies of the entity store's columns, see
+        EntityStore.snapshot.
+        """
+        pac = self.pac
+        self.board.shared = True
+        return (
+            self.state,
+            self.score,
+            self.scared_timer,
+            self.dots_eaten,
+            self.ghosts_eaten,
+            self.lives,
+            self.board.time,
+            self.board.cells,
+            pac.queue,
+            pac.size,
+            pac.anim_timer,
+            self.entities.snapshot(),
+        )
+
+    def restore(self, snapshot):
+        """Return the game to a state captured by snapshot"""
+        count = len(snapshot[-1][0]) - 1  # Pacman comes first
+        if count != len(self.ghosts):
+            raise ValueError(
+                f"snapshot has {count} ghosts, the game {len(self.ghosts)}"
+            )
+        pac = self.pac
+        (
+            self.state,
+            self.score,
+            self.scared_timer,
+            self.dots_eaten,
+            self.ghosts_eaten,
+            self.lives,
+            self.board.time,
+            self.board.cells,
+            pac.queue,
+            pac.size,
+            pac.anim_timer,
+            columns,
+        ) = snapshot
+        self.board.shared = True
+        self.entities.restore(columns)
+
+        # Paths lead from where ghosts were, and ghosts without one plan anew
+        for ghost in self.ghosts:
+            if ghost.path:
+                ghost.path = []
+        if self.grid:
+            for ghost in self.ghosts:
+                self.grid.move(ghost)
+        if self.planner:
+            self.planner.clear()
+
+        # Cached drawing no longer matches the board
+        if self.layers:
+            self.layers.close()
+            self.layers = None
+        if self.chunks:
+            self.chunks.close()
+            self.chunks = None
+        if self.observation:
+            self.observation.invalidate()
+
+    def clone(self):
+        """Independent copy of the game, sharing what never changes"""
+        game = Game.__new__(Game)
+        game.__dict__.update(self.__dict__)
+        game.__dict__.update(not_cloned)
+        game.entity_rects = []
+        game.overlay_rects = []
+        game.board = self.board.copy()
+        store = game.entities = self.entities.copy()
+        game.pac = self.pac.copy(store)
+        game.ghosts = Ghost.copy_all(self.ghosts, store)
+        if self.grid:
+            game.grid = self.grid.copy(game.ghosts)
+        if self.planner:
+            game.planner = Planner(self.planner.budget)
+        return game
 
     def update(self, dt):
+        # Remember where entities were, for render interpolation
+        self.entities.remember()
+
         match self.state:
             case Game.State.Playing:
                 # Update entities
-                self.pac.update(dt, self.board)
+                started = profiler.start()
+                self.pac.update(dt, self.board, self.input.direction(self))
+                started = profiler.lap("pacman", started)
                 for ghost in self.ghosts:
-                    ghost.update(dt, self.pac, self.ghosts, self.board)
+                    arrived = ghost.update(
+                        dt, self.pac, self.ghosts, self.board, self.planner
+                    )
+                    if arrived and self.grid:
+                        self.grid.move(ghost)
+                if self.planner:
+                    self.planner.run(self.board)
+                started = profiler.lap("ghosts", started)
 
                 # Eat dots
-                match self.board.get_wrapped(self.pac.pos):
-                    case Tile.Dot:
-                        self.board.set_wrapped(self.pac.pos, Tile.Empty)
+                store = self.entities
+                board = self.board
+                px = store.x[self.pac.index]
+                py = store.y[self.pac.index]
+                x = int(px) % board.width
+                y = int(py) % board.height
+                match board.cells[y * board.width + x]:
+                    case Tile.Dot.value:
+                        board.set(x, y, Tile.Empty)
                         self.score += dot_score
                         self.dots_eaten += 1
-                    case Tile.Power:
-                        self.board.set_wrapped(self.pac.pos, Tile.Empty)
+                        if self.session:
+                            telemetry.record(
+                                self.session, board.time, events.dot, self.score, x, y
+                            )
+                    case Tile.Power.value:
+                        board.set(x, y, Tile.Empty)
                         self.score += power_score
                         self.dots_eaten += 1
                         self.scared_timer = scared_duration
                         for ghost in self.ghosts:
-                            ghost.state = Ghost.State.Scared
-                            ghost.scared_spawn = False
+                            store.state[ghost.index] = scared
+                            store.scared_spawn[ghost.index] = False
+                        if self.session:
+                            telemetry.record(
+                                self.session, board.time, events.power, self.score, x, y
+                            )
 
                 # Pac/Ghost collision
-                for ghost in self.ghosts:
-                    if (ghost.pos - self.pac.pos).length() < 0.3:
-                        match ghost.state:
-                            case Ghost.State.ChaseScatter:
+                near = self.grid.near(px, py) if self.grid else self.ghosts
+                for ghost in near:
+                    dx = store.x[ghost.index] - px
+                    dy = store.y[ghost.index] - py
+                    if sqrt(dx * dx + dy * dy) < 0.3:
+                        match store.state[ghost.index]:
+                            case Ghost.State.ChaseScatter.value:
                                 self.state = Game.State.Dying
+                                if self.session:
+                                    telemetry.record(
+                                        self.session,
+                                        board.time,
+                                        events.death,
+                                        self.lives,
+                                        x,
+                                        y,
+                                    )
                                 return
-                            case Ghost.State.Scared:
-                                ghost.state = Ghost.State.Eaten
+                            case Ghost.State.Scared.value:
+                                store.state[ghost.index] = eaten
                                 self.ghosts_eaten += 1
-                                self.score += ghost_mul * 2 ** min(self.ghosts_eaten, 4)
+                                multiplier = 2 ** min(self.ghosts_eaten, 4)
+                                self.score += ghost_mul * multiplier
+                                if self.session:
+                                    telemetry.record(
+                                        self.session,
+                                        board.time,
+                                        events.ghost,
+                                        multiplier,
+                                        ghost.id,
+                                    )
 
                 # Win condition
                 if self.dots_eaten == self.board.max_dots:
                     self.state = Game.State.Win
+                    if self.session:
+                        telemetry.record(
+                            self.session, board.time, events.win, self.score
+                        )
                     return
 
                 self.board.time += dt
+                if self.session:
+                    phase = board.scatter()
+                    if phase != self.phase:
+                        self.phase = phase
+                        telemetry.record(self.session, board.time, events.phase, phase)
 
                 # Scared timer
                 self.scared_timer = max(0, self.scared_timer - dt)
                 if self.scared_timer == 0:
                     for ghost in self.ghosts:
-                        if ghost.state == Ghost.State.Scared:
-                            ghost.state = Ghost.State.ChaseScatter
+                        if store.state[ghost.index] == scared:
+                            store.state[ghost.index] = chase
+                profiler.lap("rules", started)
             case Game.State.Dying:
                 self.pac.size = max(0, self.pac.size - 0.5 * dt)
                 if self.pac.size == 0:
                     if self.lives == 0:
                         self.state = Game.State.Lose
+                        if self.session:
+                            telemetry.record(
+                                self.session, self.board.time, events.lose, self.score
+                            )
                     else:
-                        self.lives = 1
+                        self.lives -= 1
                         self.pac.reset()
                         for ghost in self.ghosts:
                             ghost.reset()
+                            if self.grid:
+                                self.grid.move(ghost)
+                        if self.planner:
+                            self.planner.clear()
                         self.state = Game.State.Playing
 
     def space(self):
         match self.state:
             case Game.State.Start | Game.State.Lose | Game.State.Win:
-                self.__init__()
+                observation = self.observation
+                budget = self.planner and self.planner.budget
+                self.__init__(self.input, self.maze, self.crowd, budget)
+                self.observation = observation
                 self.state = Game.State.Playing
+                if telemetry.enabled:
+                    self.session = telemetry.begin()
+                    telemetry.record(self.session, 0, events.start, len(self.ghosts))
+
+    def observe(self):
+        """Planes and scalars for learning agents, see observation.py
+
+        The same arrays are returned every time, updated in place.
+        """
+        if self.observation is None:
+            from observation import Observation
+
+            self.observation = Observation(self)
+        return self.observation.update()
+
+    def render(self, screen, alpha=1):
+        """Draw a frame, returning the rects that changed or None if all did
 
-    def render(self, screen):
+        Entities are drawn alpha of the way from their previous position to
+        their current one. Boards that would need tiles smaller than min_tile
+        to fit are drawn at min_tile, scrolling to follow Pacman.
+        """
         screen_size = Vector2(screen.get_width(), screen.get_height())
         scale = min(
             screen_size.x / (self.board.width + top_size),
             screen_size.y / (self.board.height + top_size),
         )
-        screen.fill((0, 0, 0))
-        top_offset = Vector2(0, top_size * scale)
-        offset = (
-            (screen_size - top_offset) / 2
-            - Vector2(
-                scale * self.board.width / 2,
-                scale * self.board.height / 2,
+        if scale < min_tile:
+            scale = min_tile
+            offset = self.camera(screen_size, scale, alpha)
+            draw = self.render_view
+            origin = Vector2(scale, top_size * scale)  # Where text is placed from
+        else:
+            top_offset = Vector2(0, top_size * scale)
+            offset = (
+                (screen_size - top_offset) / 2
+                - Vector2(
+                    scale * self.board.width / 2,
+                    scale * self.board.height / 2,
+                )
+                + top_offset
+            )
+            draw = self.render_game
+            origin = offset
+        if self.state in (Game.State.Playing, Game.State.Dying):
+            self.still_shown = False
+            return draw(screen, scale, offset, alpha=alpha)
+
+        # The other screens don't move, so they are composed once and
+        # only drawn again when what they show changes
+        key = (self.state, screen.get_size(), self.score, self.lives, *self.overlay)
+        if key != self.still_key:
+            self.still_key = key
+            self.still = self.compose_still(
+                screen.get_size(), draw, scale, offset, origin
             )
-            + top_offset
+            self.still_shown = False
+        elif self.still_shown:
+            return []
+        screen.blit(self.still, (0, 0))
+        self.still_shown = True
+        return None
+
+    def compose_still(self, size, draw, scale, offset, origin):
+        """The Start, Lose or Win screen, drawn on a new surface over the
+        board drawn by draw"""
+        surface = pygame.Surface(size)
+        if self.state == Game.State.Start:
+            title = "PAC-MAN"
+            prompt = "Press SPACE to start"
+        else:
+            title = "YOU WIN!" if self.state == Game.State.Win else "GAME OVER!"
+            prompt = "Press SPACE to play again"
+            draw(surface, scale, offset, full=True)
+            draw_rect_alpha(surface, (0, 0, 0, 180), ((0, 0), size))
+        surface.blit(
+            text(title, scale * 4, (255, 255, 0)), origin + Vector2(0, scale * top_size)
         )
-        match self.state:
-            case Game.State.Start:
-                screen.blit(
-                    text("PAC-MAN", scale * 4, (255, 255, 0)),
-                    offset + Vector2(0, scale * top_size),
-                )
-                screen.blit(
-                    text("Press SPACE to start", scale * 2, (255, 255, 0)),
-                    offset + Vector2(0, scale * (top_size + 6)),
-                )
-            case Game.State.Playing:
-                self.render_game(screen, scale, offset)
-            case Game.State.Dying:
-                self.render_game(screen, scale, offset)
-            case Game.State.Lose:
-                self.render_game(screen, scale, offset)
-                draw_rect_alpha(screen, (0, 0, 0, 180), (Vector2(), screen_size))
-                screen.blit(
-                    text("GAME OVER!", scale * 4, (255, 255, 0)),
-                    offset + Vector2(0, scale * top_size),
-                )
-                screen.blit(
-                    text("Press SPACE to play again", scale * 2, (255, 255, 0)),
-                    offset + Vector2(0, scale * (top_size + 6)),
-                )
-            case Game.State.Win:
-                self.render_game(screen, scale, offset)
-                draw_rect_alpha(screen, (0, 0, 0, 180), (Vector2(), screen_size))
-                screen.blit(
-                    text("YOU WIN!", scale * 4, (255, 255, 0)),
-                    offset + Vector2(0, scale * top_size),
-                )
-                screen.blit(
-                    text("Press SPACE to play again", scale * 2, (255, 255, 0)),
-                    offset + Vector2(0, scale * (top_size + 6)),
-                )
-
-    def render_game(self, screen, scale, offset):
-
-        # Score
+        surface.blit(
+            text(prompt, scale * 2, (255, 255, 0)),
+            origin + Vector2(0, scale * (top_size + 6)),
+        )
+        return surface
+
+    def camera(self, screen_size, scale, alpha=1):
+        """Board offset that centers Pacman below the top bar, within the board"""
+        top = top_size * scale
+        view = screen_size - Vector2(0, top)
+        pos = interpolate(self.pac.prev_pos, self.pac.pos, alpha)
+        offset = Vector2(0, top) + view / 2 - pos * scale
+        board_size = Vector2(self.board.width, self.board.height) * scale
+        for axis in range(2):
+            if board_size[axis] <= view[axis]:
+                offset[axis] = (view[axis] - board_size[axis]) / 2
+            else:
+                offset[axis] = max(view[axis] - board_size[axis], min(0, offset[axis]))
+            offset[axis] = round(offset[axis])
+        offset.y += top
+        return offset
+
+    def render_view(self, screen, scale, offset, full=False, alpha=1):
+        """Draw the visible part of the board from cached chunks
+
+        The view scrolls, so the whole screen is redrawn and None returned.
+        """
+        if not self.chunks or not self.chunks.matches(self.board, scale):
+            if self.chunks:
+                self.chunks.close()
+            self.chunks = ChunkCache(self.board, scale)
+        screen.fill((0, 0, 0))
+        self.chunks.draw(screen, offset)
+
+        # Entities in view
+        view = screen.get_rect().inflate(scale * 2, scale * 2)
+        shown = [
+            entity
+            for entity in [self.pac, *self.ghosts]
+            if view.collidepoint(offset + entity.pos * scale)
+        ]
+        screen.blits(self.sprites(shown, scale, offset, alpha), False)
+
+        # Top bar, fixed to the screen
+        width = screen.get_width()
+        screen.fill((0, 0, 0), (0, 0, width, top_size * scale))
         screen.blit(
-            text(str(self.score).zfill(4), top_size * scale, "white"),
-            offset - Vector2(0, top_size * scale),
+            text(str(self.score).zfill(4), top_size * scale, "white"), (scale, 0)
         )
-
-        # Lives
         for i in range(self.lives):
-            pos = offset + scale * Vector2(self.board.width - 0.5 - i, -0.5)
+            pos = (width - scale * (1 + i), scale * (top_size - 0.5))
             pygame.draw.circle(screen, (255, 255, 0), pos, scale * 0.5)
+        for i, line in enumerate(self.overlay):
+            screen.blit(
+                text(line, scale * 0.7, (0, 255, 0)), (scale * 6, scale * 0.7 * i)
+            )
+        return None
+
+    def sprites(self, entities, scale, offset, alpha=1):
+        """Blit sequence for entities, with Pacman under the ghosts while playing"""
+        if not self.atlas or self.atlas.scale != scale:
+            self.atlas = SpriteAtlas(scale)
+        sprites = [
+            ghost.sprite(self.atlas, offset, scale, self.scared_timer, alpha)
+            for ghost in entities
+            if ghost is not self.pac
+        ]
+        if self.pac in entities:
+            pac = self.pac.sprite(self.atlas, offset, scale, alpha)
+            if self.state == Game.State.Playing:
+                sprites.insert(0, pac)
+            else:
+                sprites.append(pac)
+        return sprites
+
+    def render_game(self, screen, scale, offset, full=False, alpha=1):
+        """Draw the game over the cached maze layers
+
+        Only the areas that changed since the last call are redrawn, unless
+        full is set or the layers had to be rebuilt. Returns the changed
+        rects, or None if the whole screen was redrawn.
+        """
+        size = screen.get_size()
+        if not self.layers or not self.layers.matches(self.board, size):
+            if self.layers:
+                self.layers.close()
+            self.layers = MazeLayers(self.board, size, scale, offset)
+            full = True
+
+        # Restore the background under everything that may have changed
+        top_bar = (self.score, self.lives)
+        redraw_top = full or top_bar != self.top_bar
+        if full:
+            screen.blit(self.layers.dots, (0, 0))
+            dirty = None
+        else:
+            dirty = self.layers.dirty + self.entity_rects + self.overlay_rects
+            if redraw_top:
+                dirty.append(self.top_rect)
+            for rect in dirty:
+                screen.blit(self.layers.dots, rect, rect)
+        self.layers.dirty = []
+
+        if redraw_top:
+            self.top_bar = top_bar
+
+            # Score
+            self.top_rect = screen.blit(
+                text(str(self.score).zfill(4), top_size * scale, "white"),
+                offset - Vector2(0, top_size * scale),
+            )
 
-        # Board
-        for j, row in enumerate(self.board.tiles):
-            for i, tile in enumerate(row):
-                corner = offset + Vector2(i, j) * scale
-                size = Vector2(scale)
-                center = corner + size / 2
-                size += Vector2(1, 1)  # Render fix
-                match tile:
-                    case Tile.Wall:
-                        pygame.draw.rect(screen, (0, 0, 244), (corner, size))
-                    case Tile.Dot:
-                        pygame.draw.circle(screen, (255, 255, 128), center, scale / 8)
-                    case Tile.Power:
-                        pygame.draw.circle(screen, (255, 255, 128), center, scale / 3)
-                    case Tile.Gate:
-                        corner.y += scale * 0.4
-                        size.y *= 0.2
-                        pygame.draw.rect(screen, (255, 255, 255), (corner, size))
-
-        if self.state == Game.State.Playing:
-            self.pac.render(screen, offset, scale)
-
-        # Ghosts
-        for ghost in self.ghosts:
-            ghost.render(screen, offset, scale, self.scared_timer)
+            # Lives
+            for i in range(self.lives):
+                pos = offset + scale * Vector2(self.board.width - 0.5 - i, -0.5)
+                life = pygame.draw.circle(screen, (255, 255, 0), pos, scale * 0.5)
+                self.top_rect.union_ip(life)
+            if dirty is not None:
+                dirty.append(self.top_rect)
+
+        entities = [self.pac, *self.ghosts]
+        rects = screen.blits(self.sprites(entities, scale, offset, alpha))
+        self.entity_rects = rects
+
+        # Overlay
+        self.overlay_rects = []
+        for i, line in enumerate(self.overlay):
+            self.overlay_rects.append(
+                screen.blit(
+                    text(line, scale * 0.7, (0, 255, 0)),
+                    offset + Vector2(scale * 5, scale * (0.7 * i - top_size)),
+                )
+            )
+        return None if dirty is None else dirty + rects + self.overlay_rects
+
+
+class SpriteAtlas:
+    """Pacman and ghost sprites, drawn once for one scale
+
+    Every sprite is a square centered on the entity's position, keyed out
+    on black.
+    """
+
+    pac_frames = 32  # Sizes Pacman is drawn at, from nothing to a full tile
+
+    def __init__(self, scale):
+        self.scale = scale
+        side = ceil(scale) + 2
+        self.side = side
+        self.anchor = Vector2(side / 2)  # Sprite offset of the entity position
+        self.pac_sprites = {}  # Frame -> surface
+        self.ghost_sprites = {}  # Color -> surface
+
+        # Eaten ghosts leave only their eyes, as a bar
+        self.eyes = self.surface()
+        corner = self.anchor + Vector2(-0.5, -0.1) * scale
+        pygame.draw.rect(self.eyes, (255, 255, 255), (corner, (scale, scale * 0.2)))
+
+    def surface(self):
+        surface = pygame.Surface((self.side, self.side))
+        surface.set_colorkey((0, 0, 0), pygame.RLEACCEL)
+        return surface
+
+    def pacman(self, size):
+        frame = round(max(0, min(1, size)) * SpriteAtlas.pac_frames)
+        sprite = self.pac_sprites.get(frame)
+        if sprite is None:
+            sprite = self.pac_sprites[frame] = self.surface()
+            radius = self.scale / 2 * frame / SpriteAtlas.pac_frames
+            pygame.draw.circle(sprite, (255, 255, 0), self.anchor, radius)
+        return sprite
+
+    def ghost(self, color):
+        sprite = self.ghost_sprites.get(color)
+        if sprite is None:
+            sprite = self.ghost_sprites[color] = self.surface()
+            scale = self.scale
+            head = self.anchor + Vector2(-0.01, -0.1) * scale
+            pygame.draw.circle(sprite, color, head, 0.4 * scale)
+            corner = self.anchor + Vector2(-0.4, -0.1) * scale
+            pygame.draw.rect(sprite, color, (corner, Vector2(0.8, 0.6) * scale))
+        return sprite
+
+
+def draw_tile(surface, corner, scale, tile):
+    """Draw a tile with its top left corner at corner"""
+    size = Vector2(scale)
+    center = corner + size / 2
+    size += Vector2(1, 1)  # Render fix
+    match tile:
+        case Tile.Wall:
+            return pygame.draw.rect(surface, (0, 0, 244), (corner, size))
+        case Tile.Dot:
+            return pygame.draw.circle(surface, (255, 255, 128), center, scale / 8)
+        case Tile.Power:
+            return pygame.draw.circle(surface, (255, 255, 128), center, scale / 3)
+        case Tile.Gate:
+            corner = corner + Vector2(0, scale * 0.4)
+            size.y *= 0.2
+            return pygame.draw.rect(surface, (255, 255, 255), (corner, size))
+
+
+class MazeLayers:
+    """Walls and dots pre-rendered for one board at one window size"""
+
+    def __init__(self, board, size, scale, offset):
+        self.board = board
+        self.size = size
+        self.scale = scale
+        self.offset = offset
+        self.dirty = []
+
+        # Walls and the gate never change
+        self.walls = pygame.Surface(size)
+        for j in range(board.height):
+            for i in range(board.width):
+                tile = board.get(i, j)
+                if tile == Tile.Wall or tile == Tile.Gate:
+                    self.draw_tile(self.walls, i, j, tile)
+
+        # Dots are drawn over the walls and cleared as they are eaten
+        self.dots = self.walls.copy()
+        for j in range(board.height):
+            for i in range(board.width):
+                tile = board.get(i, j)
+                if tile == Tile.Dot or tile == Tile.Power:
+                    self.draw_tile(self.dots, i, j, tile)
+        board.listeners.append(self.tile_changed)
+
+    def matches(self, board, size):
+        return self.board is board and self.size == size
+
+    def close(self):
+        self.board.listeners.remove(self.tile_changed)
+
+    def draw_tile(self, surface, i, j, tile):
+        corner = self.offset + Vector2(i, j) * self.scale
+        return draw_tile(surface, corner, self.scale, tile)
+
+    def tile_changed(self, i, j, tile):
+        corner = self.offset + Vector2(i, j) * self.scale
+        rect = pygame.Rect(corner, Vector2(self.scale)).inflate(2, 2)
+        self.dots.blit(self.walls, rect, rect)
+        if tile == Tile.Dot or tile == Tile.Power:
+            self.draw_tile(self.dots, i, j, tile)
+        self.dirty.append(rect)
+
+
+class ChunkCache:
+    """Square blocks of the board pre-rendered on demand, least recent evicted
+
+    Drawing a view blits the few chunks it overlaps, so its cost depends on
+    the screen size rather than the board size.
+    """
+
+    size = 16  # Tiles along each side of a chunk
+    max_chunks = 128
+
+    def __init__(self, board, scale):
+        self.board = board
+        self.scale = scale
+        self.chunks = OrderedDict()  # (cx, cy) -> Surface
+        board.listeners.append(self.tile_changed)
+
+    def matches(self, board, scale):
+        return self.board is board and self.scale == scale
+
+    def close(self):
+        self.board.listeners.remove(self.tile_changed)
+
+    def get(self, cx, cy):
+        chunk = self.chunks.get((cx, cy))
+        if chunk is not None:
+            self.chunks.move_to_end((cx, cy))
+            return chunk
+        n = ChunkCache.size
+        chunk = pygame.Surface((n * self.scale, n * self.scale))
+        # Starting a tile early, for walls that overlap into the chunk
+        for j in range(cy * n - 1, min((cy + 1) * n, self.board.height)):
+            for i in range(cx * n - 1, min((cx + 1) * n, self.board.width)):
+                self.draw_tile(chunk, cx, cy, i, j)
+        self.chunks[(cx, cy)] = chunk
+        if len(self.chunks) > ChunkCache.max_chunks:
+            self.chunks.popitem(last=False)
+        return chunk
+
+    def draw_tile(self, chunk, cx, cy, i, j):
+        tile = self.board.get(i, j)
+        if tile is not None and tile != Tile.Empty:
+            n = ChunkCache.size
+            draw_tile(
+                chunk, Vector2(i - cx * n, j - cy * n) * self.scale, self.scale, tile
+            )
+
+    def draw(self, screen, offset):
+        """Blit the chunks overlapping the screen, with the board at offset"""
+        span = ChunkCache.size * self.scale
+        width, height = screen.get_size()
+        columns = ceil(self.board.width / ChunkCache.size)
+        rows = ceil(self.board.height / ChunkCache.size)
+        for cy in range(max(0, floor(-offset.y / span)), rows):
+            y = offset.y + cy * span
+            if y >= height:
+                break
+            for cx in range(max(0, floor(-offset.x / span)), columns):
+                x = offset.x + cx * span
+                if x >= width:
+                    break
+                screen.blit(self.get(cx, cy), (x, y))
+
+    def tile_changed(self, i, j, tile):
+        n = ChunkCache.size
+        cx, cy = i // n, j // n
+        chunk = self.chunks.get((cx, cy))
+        if chunk is None:
+            return
+        corner = Vector2(i - cx * n, j - cy * n) * self.scale
+        chunk.fill((0, 0, 0), (corner, Vector2(self.scale)))
 
-        if self.state != Game.State.Playing:
-            self.pac.render(screen, offset, scale)
+        # Walls next to the tile overlap it by a pixel
+        for y in range(j - 1, min((cy + 1) * n, j + 2)):
+            for x in range(i - 1, min((cx + 1) * n, i + 2)):
+                self.draw_tile(chunk, cx, cy, x, y)
 
 
 def text(str, size, color):
     """Create a text surface with a cached font"""
-    size = int(size)
-    if size not in text_dict:
-        text_dict[size] = pygame.font.Font(pygame.font.get_default_font(), size)
-    return text_dict[size].render(str, True, color)
+    return text_cache.render(str, int(size), color)
 
 
-text_dict = {}
+text_cache = TextCache()
 
 
 def draw_rect_alpha(surface, color, rect):
@@ -545,34 +1289,137 @@ def draw_rect_alpha(surface, color, rect):
     surface.blit(shape_surf, rect)
 
 
-# Initialization
-pygame.init()
-pygame.font.init()
-pygame.display.set_caption("PAC-MAN")
-screen = pygame.display.set_mode((1280, 720), pygame.RESIZABLE)
-clock = pygame.time.Clock()
-game = Game()
-
-running = True
-
-# Main loop
-while running:
-
-    # Handle events
-    for event in pygame.event.get():
-        match event.type:
-            case pygame.QUIT:
-                running = False
-            case pygame.KEYDOWN:
-                match event.key:
-                    case pygame.K_SPACE:
-                        game.space()
-
-    # Update
-    game.update(clock.tick(120) / 1000)
-
-    # Render
-    game.render(screen)
-    pygame.display.flip()
-
-pygame.quit()
+def main():
+    parser = argparse.ArgumentParser(description="Play PAC-MAN")
+    parser.add_argument(
+        "--record",
+        metavar="PATH",
+        help="save a replay of each game, numbered from PATH",
+    )
+    parser.add_argument(
+        "--profile", action="store_true", help="show frame timings (toggle with F3)"
+    )
+    parser.add_argument(
+        "--profile-out", metavar="PATH", help="stream frame timings to .csv or .jsonl"
+    )
+    parser.add_argument("--maze", help="maze file, or WIDTHxHEIGHT to generate one")
+    parser.add_argument("--seed", type=int, help="seed for generated mazes")
+    parser.add_argument("--crowd", type=int, default=0, help="extra ghosts to add")
+    parser.add_argument(
+        "--startup-report", action="store_true", help="print time to first frame"
+    )
+    parser.add_argument(
+        "--fps", type=int, default=120, help="frame cap while playing, 0 for none"
+    )
+    parser.add_argument(
+        "--vsync", action="store_true", help="wait for the display's refresh"
+    )
+    parser.add_argument(
+        "--plan-budget",
+        type=int,
+        default=1000,
+        metavar="US",
+        help="microseconds of ghost route planning per frame (not when recording)",
+    )
+    parser.add_argument(
+        "--telemetry", metavar="DIR", help="record game events, see telemetry.py"
+    )
+    args = parser.parse_args()
+    startup = StartupTimer(import_started)
+    startup.lap("imports")
+    maze = args.maze and open_maze(args.maze, args.seed)
+    startup.lap("maze")
+    profiler.enabled = args.profile or bool(args.profile_out)
+    if args.profile_out:
+        profiler.open(args.profile_out)
+    if args.telemetry:
+        telemetry.open(args.telemetry)
+
+    # Only the video subsystem, fonts are started on first use
+    pygame.display.init()
+    pygame.display.set_caption("PAC-MAN")
+    try:
+        screen = pygame.display.set_mode(
+            (1280, 720), pygame.RESIZABLE, vsync=args.vsync
+        )
+    except pygame.error:
+        # Not every driver can sync, so fall back to the frame cap alone
+        screen = pygame.display.set_mode((1280, 720), pygame.RESIZABLE)
+    startup.lap("display")
+    pacer = FramePacer(args.fps)
+    timestep = FixedTimestep(1 / tick_rate, max_catch_up)
+    # Replays re-simulate every step, so recorded games plan without a budget
+    budget = None if args.record else args.plan_budget
+    game = Game(KeyboardInput(), maze, args.crowd, budget)
+    startup.lap("game")
+    recorder = None
+    if args.record:
+        from replay import Recorder
+
+        recorder = Recorder(game)
+
+    running = True
+
+    # Main loop
+    while running:
+
+        # Wait for the next frame, or for input on a still screen
+        animating = profiler.enabled or game.state in (
+            Game.State.Playing,
+            Game.State.Dying,
+        )
+        elapsed = pacer.wait(animating)
+
+        # Handle events
+        started = profiler.start()
+        for event in pygame.event.get():
+            match event.type:
+                case pygame.QUIT:
+                    running = False
+                case pygame.KEYDOWN:
+                    match event.key:
+                        case pygame.K_SPACE:
+                            if recorder and recorder.ticks:
+                                recorder.save_numbered(args.record)
+                            game.space()
+                            if recorder:
+                                recorder.start()
+                        case pygame.K_F3:
+                            profiler.toggle()
+        profiler.lap("events", started)
+
+        # Update
+        update = recorder.update if recorder else game.update
+        started = profiler.start()
+        if game.planner:
+            game.planner.start_frame()  # Catching up shares one frame's budget
+        alpha = timestep.advance(elapsed, update)
+        started = profiler.lap("update", started)
+
+        # Render
+        if profiler.enabled and profiler.frames % 15 == 0:
+            game.overlay = profiler.summary()
+        elif not profiler.enabled:
+            game.overlay = []
+        rects = game.render(screen, alpha)
+        started = profiler.lap("render", started)
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+        profiler.lap("flip", started)
+        profiler.end_frame()
+        if startup:
+            startup.lap("first frame")
+            if args.startup_report:
+                print(startup.report())
+            startup = None
+
+    if recorder and recorder.ticks:
+        recorder.save_numbered(args.record)
+    profiler.close()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""Mazes loaded from text or binary files, or generated at any size
+
+Text mazes use the same characters as main.board_spec, one row per line:
+X wall, . dot, o power pellet, - ghost gate, S Pacman's spawn, 1-9 ghost
+spawns and space for empty floor. Binary mazes hold the parsed cells and
+neighbor masks, and loading a text maze saves one alongside it so the next
+load skips parsing.
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import re
+import struct
+import zlib
+
+import routing
+
+# Tile values by maze character, the same as main.Tile
+codes = {"X": 1, " ": 0, ".": 2, "o": 3, "-": 4, "S": 0}
+codes.update((str(n), 0) for n in range(1, 10))
+wall = codes["X"]
+dot = codes["."]
+power = codes["o"]
+gate = codes["-"]
+invalid = 255
+decode = bytes(codes.get(chr(c), invalid) for c in range(256))
+spawn_chars = re.compile(rb"[S1-9]")
+
+magic = b"PACMAZE"
+version = 1
+header_format = struct.Struct("<7sBqqIIIIII")
+parsed_suffix = ".parsed"  # Added to a text maze's path for its parsed copy
+
+
+def build_masks(width, height, cells):
+    """Non-wall neighbors of every tile as bits in routing.dirs order, wrapping
+
+    Each direction's flags are shifted into place for the whole board at
+    once and summed as one big integer, which never carries since the bits
+    are distinct.
+    """
+    total = 0
+    size = width * height
+    for bit, (dx, dy) in enumerate(routing.dirs):
+        flags = bytes(cells).translate(
+            bytes(0 if c == wall else 1 << bit for c in range(256))
+        )
+        # Row y takes the flags of row y + dy, column x those of column x + dx
+        shift = dy % height * width
+        flags = flags[shift:] + flags[:shift]
+        shift = dx % width
+        if shift:
+            flags = b"".join(
+                flags[i + shift : i + width] + flags[i : i + shift]
+                for i in range(0, size, width)
+            )
+        total += int.from_bytes(flags, "little")
+    return total.to_bytes(size, "little")
+
+
+class Maze:
+    def __init__(self, width, height, cells, pac, ghosts, masks=None):
+        self.width = width
+        self.height = height
+        self.cells = bytes(cells)  # Tile values, row by row
+        self.pac = pac  # Spawn tile of Pacman
+        self.ghosts = ghosts  # Spawn tile of each ghost, by id
+        self.masks = masks or build_masks(width, height, self.cells)
+        self.max_dots = self.cells.count(dot) + self.cells.count(power)
+        self.key = hashlib.sha1(
+            struct.pack("<II", width, height) + self.cells
+        ).hexdigest()
+
+    def walkable(self):
+        """One flag per tile, set where ghosts can walk"""
+        return self.cells.translate(bytes(int(c != wall) for c in range(256)))
+
+    def routes(self):
+        return routing.load_or_build(self.key, self.width, self.height, self.walkable())
+
+    @staticmethod
+    def parse(lines):
+        """Parse rows of maze characters, from any iterable of str or bytes"""
+        cells = bytearray()
+        pac = None
+        ghosts = {}
+        width = None
+        y = 0
+        for line in lines:
+            if isinstance(line, str):
+                line = line.encode()
+            line = line.rstrip(b"\r\n")
+            if not line:
+                continue
+            if width is None:
+                width = len(line)
+            elif len(line) != width:
+                raise ValueError(f"row {y + 1} is {len(line)} tiles, not {width}")
+            row = line.translate(decode)
+            if invalid in row:
+                x = row.index(invalid)
+                raise ValueError(f"unknown tile {line[x:x + 1]!r} at {x}, {y}")
+            cells += row
+            for match in spawn_chars.finditer(line):
+                if match.group() == b"S":
+                    pac = (match.start(), y)
+                else:
+                    ghosts[int(match.group())] = (match.start(), y)
+            y += 1
+        if width is None:
+            raise ValueError("maze is empty")
+        if pac is None:
+            raise ValueError("maze has no Pacman spawn")
+        if sorted(ghosts) != list(range(1, len(ghosts) + 1)):
+            raise ValueError("ghosts must be numbered from 1 without gaps")
+        return Maze(width, y, cells, pac, [ghosts[n] for n in sorted(ghosts)])
+
+    def pack(self, source=(0, 0)):
+        """The binary form, stamped with the (size, mtime) of a source"""
+        header = header_format.pack(
+            magic,
+            version,
+            *source,
+            self.width,
+            self.height,
+            *self.pac,
+            len(self.ghosts),
+            len(self.cells),
+        )
+        spawns = b"".join(struct.pack("<II", *pos) for pos in self.ghosts)
+        return header + spawns + zlib.compress(self.cells + self.masks)
+
+    @staticmethod
+    def unpack(data, source=None, name="maze"):
+        """Maze from its binary form, which must be stamped with source if given"""
+        if len(data) < header_format.size:
+            raise EOFError(f"{name} is truncated")
+        (
+            file_magic,
+            file_version,
+            size,
+            mtime,
+            width,
+            height,
+            px,
+            py,
+            count,
+            length,
+        ) = header_format.unpack_from(data)
+        if file_magic != magic or file_version != version:
+            raise ValueError(f"{name} is not a version {version} maze")
+        if source is not None and source != (size, mtime):
+            raise ValueError(f"{name} is older than its source")
+        i = header_format.size
+        spawns = data[i : i + 8 * count]
+        cells = zlib.decompress(data[i + 8 * count :])
+        if len(cells) != 2 * length or length != width * height:
+            raise EOFError(f"{name} is truncated")
+        ghosts = [struct.unpack_from("<II", spawns, 8 * i) for i in range(count)]
+        return Maze(width, height, cells[:length], (px, py), ghosts, cells[length:])
+
+    def save(self, path, source=(0, 0)):
+        """Write through a temporary file, as for RouteTable.save"""
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(self.pack(source))
+        os.replace(temp, path)
+
+    @staticmethod
+    def read_binary(path, source=None):
+        with open(path, "rb") as f:
+            return Maze.unpack(f.read(), source, path)
+
+    @staticmethod
+    def load(path):
+        """Load a text or binary maze file, using the parsed copy of text ones"""
+        with open(path, "rb") as f:
+            binary = f.read(len(magic)) == magic
+        if binary:
+            return Maze.read_binary(path)
+        stat = os.stat(path)
+        source = (stat.st_size, stat.st_mtime_ns)
+        parsed = path + parsed_suffix
+        try:
+            return Maze.read_binary(parsed, source)
+        except (OSError, ValueError, EOFError, zlib.error):
+            pass
+        with open(path, "rb") as f:
+            maze = Maze.parse(f)
+        try:
+            maze.save(parsed, source)
+        except OSError:
+            pass
+        return maze
+
+    @staticmethod
+    def generate(width, height, seed=None, loops=0.1, ghosts=4):
+        """Random maze with a ghost house in the middle
+
+        Corridors are carved as a spanning tree over the odd tiles, then a
+        fraction loops of the remaining inner walls are knocked out so there
+        are ways around the ghosts. Sizes are rounded up to odd numbers.
+        """
+        width = max(15, width | 1)
+        height = max(15, height | 1)
+        rng = random.Random(seed)
+        cells = bytearray([wall]) * (width * height)
+
+        # Depth-first carving from the top left corner
+        cells[width + 1] = dot
+        stack = [(1, 1)]
+        steps = [(0, 2), (2, 0), (0, -2), (-2, 0)]
+        while stack:
+            x, y = stack[-1]
+            options = [
+                (x + dx, y + dy)
+                for dx, dy in steps
+                if 0 < x + dx < width - 1
+                and 0 < y + dy < height - 1
+                and cells[(y + dy) * width + x + dx] == wall
+            ]
+            if not options:
+                stack.pop()
+                continue
+            nx, ny = rng.choice(options)
+            cells[ny * width + nx] = dot
+            cells[(y + ny) // 2 * width + (x + nx) // 2] = dot
+            stack.append((nx, ny))
+
+        # Knock out walls between two corridors
+        for y in range(1, height - 1):
+            for x in range(1 + y % 2, width - 1, 2):
+                i = y * width + x
+                if cells[i] == wall and rng.random() < loops:
+                    cells[i] = dot
+
+        # Ghost house, with an empty ring of floor around it
+        cx = width // 2 | 1
+        cy = height // 2 | 1
+        for y in range(cy - 3, cy + 4):
+            for x in range(cx - 5, cx + 6):
+                cells[y * width + x] = 0
+        for y in range(cy - 2, cy + 3):
+            for x in range(cx - 4, cx + 5):
+                edge = abs(y - cy) == 2 or abs(x - cx) == 4
+                cells[y * width + x] = wall if edge else 0
+        cells[(cy - 2) * width + cx] = gate
+        house = [(cx + dx, cy + dy) for dy in (0, -1, 1) for dx in (0, -1, 1, -2, 2)]
+
+        # Power pellets in the corners and scattered about
+        corners = [(1, 1), (width - 2, 1), (1, height - 2), (width - 2, height - 2)]
+        for _ in range(width * height // 4000):
+            corners.append((rng.randrange(1, width - 1), rng.randrange(1, height - 1)))
+        for x, y in corners:
+            if cells[y * width + x] == dot:
+                cells[y * width + x] = power
+
+        return Maze(width, height, cells, (cx, cy + 3), house[:ghosts])
+
+
+def open_maze(spec, seed=None):
+    """Maze from a path, or generated for a size given as WIDTHxHEIGHT"""
+    size = re.fullmatch(r"(\d+)x(\d+)", spec)
+    if size:
+        return Maze.generate(int(size[1]), int(size[2]), seed)
+    return Maze.load(spec)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert or generate a maze")
+    parser.add_argument("source", help="maze file, or WIDTHxHEIGHT to generate")
+    parser.add_argument("output", help="where to write the binary maze")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    maze = open_maze(args.source, args.seed)
+    maze.save(args.output)
+    print(
+        f"{args.output}: {maze.width}x{maze.height}, {maze.max_dots} dots, "
+        f"{len(maze.ghosts)} ghosts"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Tile planes and scalars describing a game, for learning agents
+
+The arrays are allocated once and patched in place: tiles through a board
+listener as they change, entities only on the tiles they left and entered.
+Agents can keep references to them, or share them through the buffer
+protocol, and read each step without any copying. Requires numpy.
+"""
+
+from math import floor
+
+import numpy as np
+
+import maze
+from main import Ghost
+
+ghost_scared = Ghost.State.Scared.value
+
+# Plane channels, followed by one plane per ghost
+walls = 0
+dots = 1
+powers = 2
+pacman = 3
+scared = 4  # Number of scared ghosts on each tile
+ghost_planes = 5
+
+# Scalar slots
+score = 0
+scared_timer = 1
+lives = 2
+
+
+class Observation:
+    def __init__(self, game):
+        self.game = game
+        self.planes = np.zeros(
+            (ghost_planes + len(game.ghosts), game.board.height, game.board.width),
+            dtype=np.float32,
+        )
+        self.scalars = np.zeros(3, dtype=np.float32)
+        self.flat = self.planes.reshape(len(self.planes), -1)  # View of planes
+        self.board = None
+        self.tiles = []  # Flat tile index of Pacman then each ghost
+        self.scared = []  # Whether each ghost is counted in the scared plane
+
+    def tile_changed(self, x, y, tile):
+        i = y * self.board.width + x
+        value = tile.value
+        self.flat[walls, i] = value == maze.wall
+        self.flat[dots, i] = value == maze.dot
+        self.flat[powers, i] = value == maze.power
+
+    def invalidate(self):
+        """Rebuild everything on the next update, after the board was replaced"""
+        if self.board:
+            self.board.listeners.remove(self.tile_changed)
+        self.board = None
+
+    def rebuild(self):
+        board = self.game.board
+        self.board = board
+        board.listeners.append(self.tile_changed)
+        cells = np.frombuffer(bytes(board.cells), dtype=np.uint8)
+        cells = cells.reshape(board.height, board.width)
+        self.planes[:] = 0
+        self.planes[walls] = cells == maze.wall
+        self.planes[dots] = cells == maze.dot
+        self.planes[powers] = cells == maze.power
+        self.tiles = [-1] * (1 + len(self.game.ghosts))
+        self.scared = [False] * len(self.game.ghosts)
+        self.place()
+
+    def place(self):
+        """Move entities to their current tiles in the planes"""
+        game = self.game
+        store = game.entities
+        flat = self.flat
+        tiles = self.tiles
+        width = self.board.width
+        height = self.board.height
+        entities = [game.pac, *game.ghosts]
+        for n, entity in enumerate(entities):
+            j = entity.index
+            i = floor(store.y[j]) % height * width + floor(store.x[j]) % width
+            old = tiles[n]
+            channel = pacman if n == 0 else ghost_planes + n - 1
+            if i != old:
+                if old >= 0:
+                    flat[channel, old] = 0
+                flat[channel, i] = 1
+                tiles[n] = i
+            if n == 0:
+                continue
+            was_scared = self.scared[n - 1]
+            is_scared = store.state[j] == ghost_scared
+            if i != old or is_scared != was_scared:
+                if old >= 0:
+                    flat[scared, old] -= was_scared
+                flat[scared, i] += is_scared
+                self.scared[n - 1] = is_scared
+
+    def update(self):
+        """Bring the arrays up to date with the game, returning (planes, scalars)"""
+        game = self.game
+        if game.board is not self.board:
+            self.invalidate()
+            self.rebuild()
+        self.place()
+        self.scalars[score] = game.score
+        self.scalars[scared_timer] = game.scared_timer
+        self.scalars[lives] = game.lives
+        return self.planes, self.scalars
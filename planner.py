@@ -0,0 +1,86 @@
+"""Ghost route planning, spread over updates within a time budget
+
+Ghosts keep the path they were given until their target moves to another
+tile. When it does they ask for a new one and carry on along the old path
+until it arrives. Requests are planned closest to Pacman first, and once
+the budget is spent the rest wait for the next frame, so any number of
+ghosts deciding at once costs the same time as a few.
+"""
+
+import heapq
+from time import perf_counter
+
+
+def plan(board, start, goal, deadline=None):
+    """Steps from start toward a goal of (tile, shared), nearest last
+
+    Shared targets use the flow fields in crowd mode. Growing a field can
+    run past perf_counter reaching deadline, which returns None to be
+    carried on with later.
+    """
+    dest, shared = goal
+    steps = None
+    if shared and board.flows:
+        steps = board.flows.path(start, dest, deadline)
+        if steps is None:
+            return None
+    if not steps:
+        steps = board.routes.path(start, dest)
+    steps.reverse()
+    return steps
+
+
+class Planner:
+    def __init__(self, budget=None):
+        self.budget = budget  # Microseconds of planning per frame, None for all
+        self.deadline = None  # End of the current frame's budget
+        self.queue = []  # (priority, order, ghost)
+        self.requests = {}  # Ghost -> (order, start tile, goal), the latest only
+        self.order = 0  # Requests made, to keep the queue first in first out
+
+    def request(self, ghost, start, goal, priority):
+        """Plan a path for ghost from start, replacing any request pending"""
+        self.order += 1
+        self.requests[ghost] = (self.order, start, goal)
+        heapq.heappush(self.queue, (priority, self.order, ghost))
+
+    def cancel(self, ghost):
+        """Forget any request pending for ghost, whose queue entry is skipped"""
+        self.requests.pop(ghost, None)
+
+    def start_frame(self):
+        """Share one budget between the updates run until the next call
+
+        Without it, each update gets the whole budget.
+        """
+        if self.budget is not None:
+            self.deadline = perf_counter() + self.budget / 1e6
+
+    def clear(self):
+        self.queue = []
+        self.requests = {}
+
+    def run(self, board):
+        """Plan pending requests, closest to Pacman first, until the budget
+        is spent"""
+        deadline = self.deadline
+        if deadline is None and self.budget is not None:
+            deadline = perf_counter() + self.budget / 1e6
+        elif deadline is not None and perf_counter() >= deadline:
+            return  # Spent by earlier updates this frame
+        while self.queue:
+            _, order, ghost = self.queue[0]
+            request = self.requests.get(ghost)
+            if request is None or request[0] != order:
+                heapq.heappop(self.queue)  # Replaced by a later request
+                continue
+            _, start, goal = request
+            path = plan(board, start, goal, deadline)
+            if path is None:
+                break  # Out of time partway, the search picks up from here
+            heapq.heappop(self.queue)
+            del self.requests[ghost]
+            ghost.path = path
+            ghost.goal = goal
+            if deadline is not None and perf_counter() >= deadline:
+                break
@@ -0,0 +1,142 @@
+"""Per-phase frame timing with rolling percentiles and optional export"""
+
+import csv
+import json
+from collections import deque
+from time import perf_counter
+
+# Phases in the order they are reported
+phases = [
+    "frame",
+    "events",
+    "update",
+    "pacman",
+    "ghosts",
+    "ghost.target",
+    "ghost.route",
+    "rules",
+    "render",
+    "flip",
+]
+
+# Phases that don't overlap, adding up to the frame time
+top_level = ["events", "update", "render", "flip"]
+
+# Short names for the overlay
+labels = {
+    "frame": "frame",
+    "events": "evt",
+    "update": "upd",
+    "pacman": "pac",
+    "ghosts": "ai",
+    "ghost.target": "tgt",
+    "ghost.route": "route",
+    "rules": "rules",
+    "render": "draw",
+    "flip": "flip",
+}
+
+
+class Profiler:
+    def __init__(self, window=240):
+        self.enabled = False
+        self.window = window  # Frames kept for percentiles
+        self.history = {name: deque(maxlen=window) for name in phases}
+        self.current = dict.fromkeys(phases, 0.0)
+        self.frames = 0
+        self.sink = None
+        self.writer = None
+
+    def start(self):
+        """Start timing, returning a token for lap, or None when disabled"""
+        return perf_counter() if self.enabled else None
+
+    def lap(self, name, started):
+        """Add the time since started to a phase and start timing again"""
+        if started is None:
+            return None
+        now = perf_counter()
+        self.current[name] += now - started
+        return now
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        for samples in self.history.values():
+            samples.clear()
+
+    def end_frame(self):
+        """Finish the frame's record, adding it to the history and the sink"""
+        if not self.enabled:
+            return
+        self.frames += 1
+        self.current["frame"] = sum(self.current[name] for name in top_level)
+        for name, seconds in self.current.items():
+            self.history[name].append(seconds)
+        if self.writer:
+            self.writer(self.frames, self.current)
+        self.current = dict.fromkeys(phases, 0.0)
+
+    def percentile(self, name, p):
+        samples = sorted(self.history[name])
+        if not samples:
+            return 0
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+    def summary(self):
+        """Overlay lines of p50/p99 milliseconds per phase"""
+        parts = [
+            f"{labels[name]} {self.percentile(name, 50) * 1000:.2f}"
+            f"/{self.percentile(name, 99) * 1000:.2f}"
+            for name in phases
+        ]
+        half = len(parts) // 2
+        return [
+            "  ".join(parts[:half]) + "  ms p50/p99",
+            "  ".join(parts[half:]),
+        ]
+
+    def open(self, path):
+        """Stream every frame's record to a .csv or .jsonl file"""
+        self.close()
+        self.sink = open(path, "w", newline="")
+        if path.endswith(".csv"):
+            writer = csv.writer(self.sink)
+            writer.writerow(["index", *(f"{name}_ms" for name in phases)])
+            self.writer = lambda frame, times: writer.writerow(
+                [frame, *(f"{times[name] * 1000:.4f}" for name in phases)]
+            )
+        else:
+            self.writer = lambda frame, times: self.sink.write(
+                json.dumps(
+                    {"index": frame, **{name: t * 1000 for name, t in times.items()}}
+                )
+                + "\n"
+            )
+
+    def close(self):
+        if self.sink:
+            self.sink.close()
+        self.sink = None
+        self.writer = None
+
+
+class StartupTimer:
+    """Seconds spent in each step of starting up, until the first frame"""
+
+    def __init__(self, started=None):
+        self.last = perf_counter() if started is None else started
+        self.first = self.last
+        self.steps = []  # (name, seconds) pairs
+
+    def lap(self, name):
+        now = perf_counter()
+        self.steps.append((name, now - self.last))
+        self.last = now
+
+    def report(self):
+        lines = [f"{name:<12} {seconds * 1000:8.1f} ms" for name, seconds in self.steps]
+        lines.append(f"{'total':<12} {(self.last - self.first) * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+
+profiler = Profiler()
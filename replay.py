@@ -0,0 +1,384 @@
+"""Compact binary game recordings with keyframes for seeking
+
+A replay holds the input of every simulation step, stored as runs of
+direction codes, plus a full snapshot of the game every so many steps.
+Playing it back re-simulates from the nearest snapshot, so any step can
+be reached without simulating the whole game.
+"""
+
+import argparse
+import os
+import struct
+import zlib
+from array import array
+
+from pygame import Vector2
+
+from main import Game, Ghost, tick_rate
+from maze import open_maze
+
+magic = b"PACREC"
+version = 5
+keyframe_interval = tick_rate * 5  # Steps between full snapshots
+
+# Direction codes, the same as the batch engine's actions
+directions = [
+    Vector2(0, 0),
+    Vector2(0, -1),
+    Vector2(0, 1),
+    Vector2(-1, 0),
+    Vector2(1, 0),
+]
+
+
+def encode_dir(dir):
+    if dir.x != 0:
+        return 3 if dir.x < 0 else 4
+    if dir.y != 0:
+        return 1 if dir.y < 0 else 2
+    return 0
+
+
+def write_varint(out, n):
+    while n >= 0x80:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def read_varint(data, i):
+    n = shift = 0
+    while True:
+        byte = data[i]
+        i += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, i
+        shift += 7
+
+
+game_format = struct.Struct("<Bqdqqqddddddd?ddI")
+ghost_format = struct.Struct("<dd?ddB?")
+header_format = struct.Struct("<6sBdI20sI")
+
+
+def encode_state(game):
+    """Pack a snapshot of a game into bytes"""
+    (
+        state,
+        score,
+        scared_timer,
+        dots_eaten,
+        ghosts_eaten,
+        lives,
+        time,
+        cells,
+        queue,
+        size,
+        anim_timer,
+        columns,
+    ) = game.snapshot()
+    x, y, dir_x, dir_y, dest_x, dest_y, moving, ghost_states, scared_spawns = columns
+    data = bytearray(
+        game_format.pack(
+            state,
+            score,
+            scared_timer,
+            dots_eaten,
+            ghosts_eaten,
+            lives,
+            time,
+            x[0],
+            y[0],
+            dir_x[0],
+            dir_y[0],
+            size,
+            anim_timer,
+            queue is not None,
+            *(queue or (0, 0)),
+            len(x) - 1,
+        )
+    )
+    for i in range(1, len(x)):
+        data += ghost_format.pack(
+            x[i],
+            y[i],
+            moving[i],
+            dest_x[i] if moving[i] else 0,
+            dest_y[i] if moving[i] else 0,
+            ghost_states[i],
+            scared_spawns[i],
+        )
+    cells = zlib.compress(cells)
+    data += struct.pack("<I", len(cells)) + cells
+    return bytes(data)
+
+
+def decode_state(game, data):
+    """Restore a game from bytes packed by encode_state"""
+    (
+        state,
+        score,
+        scared_timer,
+        dots_eaten,
+        ghosts_eaten,
+        lives,
+        time,
+        px,
+        py,
+        dx,
+        dy,
+        size,
+        anim_timer,
+        has_queue,
+        qx,
+        qy,
+        count,
+    ) = game_format.unpack_from(data)
+    i = game_format.size
+    xs = array("d", [px])
+    ys = array("d", [py])
+    dir_x = array("d", [dx])
+    dir_y = array("d", [dy])
+    dest_x = array("d", [0])
+    dest_y = array("d", [0])
+    moving = bytearray(1)
+    ghost_states = bytearray(1)
+    scared_spawns = bytearray(1)
+    for _ in range(count):
+        x, y, has_dest, gx, gy, ghost_state, scared_spawn = ghost_format.unpack_from(
+            data, i
+        )
+        i += ghost_format.size
+        xs.append(x)
+        ys.append(y)
+        dir_x.append(0)
+        dir_y.append(0)
+        dest_x.append(gx)
+        dest_y.append(gy)
+        moving.append(has_dest)
+        ghost_states.append(ghost_state)
+        scared_spawns.append(scared_spawn)
+    (length,) = struct.unpack_from("<I", data, i)
+    i += 4
+    cells = bytearray(zlib.decompress(data[i : i + length]))
+    game.restore(
+        (
+            state,
+            score,
+            scared_timer,
+            dots_eaten,
+            ghosts_eaten,
+            lives,
+            time,
+            cells,
+            Vector2(qx, qy) if has_queue else None,
+            size,
+            anim_timer,
+            (xs, ys, dir_x, dir_y, dest_x, dest_y, moving, ghost_states, scared_spawns),
+        )
+    )
+
+
+class RecordingInput:
+    """Pass directions through from another provider, remembering the last"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.code = 0
+
+    def direction(self, game):
+        dir = self.inner.direction(game)
+        self.code = encode_dir(Vector2(dir))
+        return directions[self.code]
+
+
+class ReplayInput:
+    def __init__(self):
+        self.code = 0
+
+    def direction(self, game):
+        return directions[self.code]
+
+
+class Recorder:
+    """Record a game as it is stepped through Recorder.update"""
+
+    def __init__(self, game, dt=1 / tick_rate):
+        self.game = game
+        self.dt = dt
+        if not isinstance(game.input, RecordingInput):
+            game.input = RecordingInput(game.input)
+        self.saved = 0  # Games saved by save_numbered
+        self.start()
+
+    def start(self):
+        """Begin a new recording from the game's current state"""
+        self.runs = []  # [code, count] pairs
+        self.keyframes = [(0, encode_state(self.game))]
+        self.ticks = 0
+
+    def recording(self):
+        return self.game.state in (Game.State.Playing, Game.State.Dying)
+
+    def update(self, dt):
+        if not self.recording():
+            self.game.update(dt)
+            return
+        input = self.game.input
+        input.code = 0
+        self.game.update(dt)
+        if self.runs and self.runs[-1][0] == input.code:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([input.code, 1])
+        self.ticks += 1
+        if self.ticks % keyframe_interval == 0:
+            self.keyframes.append((self.ticks, encode_state(self.game)))
+
+    def replay(self):
+        return Replay(
+            self.dt,
+            self.ticks,
+            self.runs,
+            self.keyframes,
+            self.game.maze.key,
+            self.game.crowd,
+        )
+
+    def save(self, path):
+        self.replay().save(path)
+
+    def save_numbered(self, path):
+        """Save the game as the next of path's numbered files, such as
+        game-1.pacrec, so each game of a session gets its own"""
+        self.saved += 1
+        root, ext = os.path.splitext(path)
+        self.save(f"{root}-{self.saved}{ext}")
+
+
+class Replay:
+    def __init__(self, dt, ticks, runs, keyframes, maze_key, crowd=0):
+        self.dt = dt
+        self.ticks = ticks
+        self.runs = runs
+        self.keyframes = keyframes  # (tick, state) pairs in tick order
+        self.maze_key = maze_key
+        self.crowd = crowd  # Ghosts added to the maze's own
+
+    def inputs(self):
+        """Input code of every step"""
+        codes = bytearray()
+        for code, count in self.runs:
+            codes += bytes([code]) * count
+        return codes
+
+    def save(self, path):
+        body = bytearray()
+        write_varint(body, len(self.runs))
+        for code, count in self.runs:
+            body.append(code)
+            write_varint(body, count)
+        write_varint(body, len(self.keyframes))
+        for tick, state in self.keyframes:
+            write_varint(body, tick)
+            write_varint(body, len(state))
+            body += state
+        header = header_format.pack(
+            magic,
+            version,
+            self.dt,
+            self.ticks,
+            bytes.fromhex(self.maze_key),
+            self.crowd,
+        )
+        with open(path, "wb") as f:
+            f.write(header)
+            f.write(zlib.compress(body, 9))
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            data = f.read()
+        file_magic, file_version, dt, ticks, key, crowd = header_format.unpack_from(
+            data
+        )
+        if file_magic != magic or file_version != version:
+            raise ValueError(f"{path} is not a version {version} replay")
+        body = zlib.decompress(data[header_format.size :])
+        i = 0
+        runs = []
+        count, i = read_varint(body, i)
+        for _ in range(count):
+            code = body[i]
+            n, i = read_varint(body, i + 1)
+            runs.append([code, n])
+        keyframes = []
+        count, i = read_varint(body, i)
+        for _ in range(count):
+            tick, i = read_varint(body, i)
+            length, i = read_varint(body, i)
+            keyframes.append((tick, bytes(body[i : i + length])))
+            i += length
+        return Replay(dt, ticks, runs, keyframes, key.hex(), crowd)
+
+
+class Player:
+    """Re-simulate a replay, seeking by restoring keyframes"""
+
+    def __init__(self, replay, maze=None):
+        self.replay = replay
+        self.codes = replay.inputs()
+        self.input = ReplayInput()
+        self.game = Game(self.input, maze, replay.crowd)
+        if self.game.maze.key != replay.maze_key:
+            raise ValueError("the replay was recorded on a different maze")
+        self.tick, state = replay.keyframes[0]
+        decode_state(self.game, state)
+
+    def seek(self, tick):
+        tick = max(0, min(tick, self.replay.ticks))
+        if not (self.tick <= tick and self.tick >= self.keyframe_before(tick)[0]):
+            self.tick, state = self.keyframe_before(tick)
+            decode_state(self.game, state)
+        while self.tick < tick:
+            self.step()
+
+    def keyframe_before(self, tick):
+        best = self.replay.keyframes[0]
+        for keyframe in self.replay.keyframes:
+            if keyframe[0] > tick:
+                break
+            best = keyframe
+        return best
+
+    def step(self):
+        self.input.code = self.codes[self.tick]
+        self.game.update(self.replay.dt)
+        self.tick += 1
+
+    def done(self):
+        return self.tick >= self.replay.ticks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-simulate a recorded game")
+    parser.add_argument("path")
+    parser.add_argument("--seek", type=int, help="stop at this step")
+    parser.add_argument("--maze", help="maze the game was played on, as for main.py")
+    parser.add_argument("--seed", type=int, help="seed of a generated maze")
+    args = parser.parse_args()
+
+    replay = Replay.load(args.path)
+    player = Player(replay, args.maze and open_maze(args.maze, args.seed))
+    player.seek(replay.ticks if args.seek is None else args.seek)
+    game = player.game
+    print(
+        f"step {player.tick}/{replay.ticks} ({len(replay.keyframes)} keyframes): "
+        f"score {game.score}, lives {game.lives}, dots {game.dots_eaten}, "
+        f"pacman at ({game.pac.pos.x:.2f}, {game.pac.pos.y:.2f})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""Next-hop routing over the walkable tiles of a board
+
+Small boards get a precomputed all-pairs table. Boards with more walkable
+tiles than max_table_nodes would need gigabytes for that, so they search a
+bounded area around each ghost instead.
+"""
+
+import heapq
+import os
+from array import array
+from collections import OrderedDict, deque
+from time import perf_counter
+
+# Neighbor directions, in the order ties are broken
+dirs = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+no_route = 255  # Next-hop value for unreachable or identical tiles
+unreachable = 0xFFFF  # Distance value for unreachable tiles
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+cache_version = 1
+max_table_nodes = 1500  # Largest board, in walkable tiles, given a full table
+search_limit = 2048  # Most tiles a local search expands per query
+flow_limit = 65536  # Most tiles a flow field reaches from its target
+path_limit = 64  # Most steps of a route returned by path
+
+
+class RouteTable:
+    def __init__(self, width, height, nodes, index, next_hop, dist):
+        self.width = width
+        self.height = height
+        self.nodes = nodes  # Number of walkable tiles
+        self.index = index  # Tile -> node number, or -1 if not walkable
+        self.next_hop = next_hop  # [dest * nodes + start] -> index into dirs
+        self.dist = dist  # [dest * nodes + start] -> path length in tiles
+
+    @staticmethod
+    def build(width, height, walkable):
+        """Build the table with a breadth-first search from every walkable tile
+
+        walkable holds one flag per tile, row by row.
+        """
+        index = array("i", [-1]) * (width * height)
+        tiles = []
+        for y in range(height):
+            for x in range(width):
+                if walkable[y * width + x]:
+                    index[y * width + x] = len(tiles)
+                    tiles.append((x, y))
+        n = len(tiles)
+
+        # Adjacency, wrapping around the board edges
+        adjacent = []
+        for x, y in tiles:
+            links = []
+            for d, (dx, dy) in enumerate(dirs):
+                node = index[(y + dy) % height * width + (x + dx) % width]
+                if node >= 0:
+                    links.append((node, d))
+            adjacent.append(links)
+
+        next_hop = bytearray([no_route]) * (n * n)
+        dist = array("H", [unreachable]) * (n * n)
+        for dest in range(n):
+            row = dest * n
+            dist[row + dest] = 0
+            queue = deque([dest])
+            while queue:
+                node = queue.popleft()
+                step = dist[row + node] + 1
+                for other, d in adjacent[node]:
+                    if dist[row + other] == unreachable:
+                        dist[row + other] = step
+                        # Moving from other to node is the opposite direction
+                        next_hop[row + other] = (d + 2) % 4
+                        queue.append(other)
+        return RouteTable(width, height, n, index, next_hop, dist)
+
+    def node(self, pos):
+        x, y = pos
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            return -1
+        return self.index[y * self.width + x]
+
+    def next_dir(self, start, dest):
+        """Direction of the first step from start toward dest, or None"""
+        a = self.node(start)
+        b = self.node(dest)
+        if a < 0 or b < 0:
+            return None
+        d = self.next_hop[b * self.nodes + a]
+        return None if d == no_route else dirs[d]
+
+    def next_tile(self, start, dest):
+        """Wrapped tile of the first step from start toward dest, or None"""
+        d = self.next_dir(start, dest)
+        if d is None:
+            return None
+        return (
+            (start[0] + d[0]) % self.width,
+            (start[1] + d[1]) % self.height,
+        )
+
+    def path(self, start, dest):
+        """Directions of the first path_limit steps from start to dest"""
+        steps = []
+        a = self.node(start)
+        b = self.node(dest)
+        if a < 0 or b < 0:
+            return steps
+        row = b * self.nodes
+        x, y = start
+        while len(steps) < path_limit:
+            d = self.next_hop[row + a]
+            if d == no_route:
+                break
+            dx, dy = dirs[d]
+            steps.append(dirs[d])
+            x = (x + dx) % self.width
+            y = (y + dy) % self.height
+            a = self.index[y * self.width + x]
+        return steps
+
+    def distance(self, start, dest):
+        """Path length in tiles from start to dest, or None if unreachable"""
+        a = self.node(start)
+        b = self.node(dest)
+        if a < 0 or b < 0:
+            return None
+        d = self.dist[b * self.nodes + a]
+        return None if d == unreachable else d
+
+    def save(self, path):
+        """Write the table to a temporary file and move it into place, so
+        processes building the same table at once never read half of one"""
+        header = array("i", [cache_version, self.width, self.height, self.nodes])
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as f:
+            header.tofile(f)
+            self.index.tofile(f)
+            f.write(self.next_hop)
+            self.dist.tofile(f)
+        os.replace(temp, path)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            header = array("i")
+            header.fromfile(f, 4)
+            version, width, height, n = header
+            if version != cache_version:
+                raise ValueError("stale route cache")
+            index = array("i")
+            index.fromfile(f, width * height)
+            next_hop = bytearray(f.read(n * n))
+            if len(next_hop) != n * n:
+                raise EOFError("truncated route cache")
+            dist = array("H")
+            dist.fromfile(f, n * n)
+        return RouteTable(width, height, n, index, next_hop, dist)
+
+
+class LocalRoutes:
+    """Routes found on demand by an A* search of at most search_limit tiles
+
+    When the destination is further than the search reaches, the route
+    leads toward the explored tile closest to it.
+    """
+
+    def __init__(self, width, height, walkable):
+        self.width = width
+        self.height = height
+        self.walkable = walkable  # One flag per tile, row by row
+
+    def estimate(self, a, b):
+        """Shortest distance between two tiles ignoring walls, wrapping"""
+        dx = abs(a % self.width - b % self.width)
+        dy = abs(a // self.width - b // self.width)
+        return min(dx, self.width - dx) + min(dy, self.height - dy)
+
+    def search(self, start, dest):
+        """Route as a list of direction indexes and its length, or None
+
+        The length is None when dest is out of reach and the route leads
+        to the explored tile closest to it.
+        """
+        width = self.width
+        height = self.height
+        a = start[1] * width + start[0]
+        b = dest[1] * width + dest[0]
+        if a == b or not self.walkable[a]:
+            return None
+        came = {a: None}  # Tile -> (previous tile, direction index from it)
+        cost = {a: 0}
+        closest = (self.estimate(a, b), a)
+        frontier = [(closest[0], 0, a)]
+        expanded = 0
+        end = None
+        while frontier and expanded < search_limit:
+            _, _, node = heapq.heappop(frontier)
+            if node == b:
+                end = b
+                break
+            expanded += 1
+            x = node % width
+            y = node // width
+            step = cost[node] + 1
+            for d, (dx, dy) in enumerate(dirs):
+                other = (y + dy) % height * width + (x + dx) % width
+                if not self.walkable[other] or step >= cost.get(other, step + 1):
+                    continue
+                cost[other] = step
+                came[other] = (node, d)
+                left = self.estimate(other, b)
+                closest = min(closest, (left, other))
+                heapq.heappush(frontier, (step + left, left, other))
+        node = end if end is not None else closest[1]
+        if node == a:
+            return None
+        route = []
+        while came[node]:
+            node, d = came[node]
+            route.append(d)
+        route.reverse()
+        return route, None if end is None else cost[end]
+
+    def next_dir(self, start, dest):
+        """Direction of the first step from start toward dest, or None"""
+        found = self.search(start, dest)
+        return None if found is None else dirs[found[0][0]]
+
+    def path(self, start, dest):
+        """Directions of the first path_limit steps from start toward dest"""
+        found = self.search(start, dest)
+        return [] if found is None else [dirs[d] for d in found[0][:path_limit]]
+
+    def next_tile(self, start, dest):
+        """Wrapped tile of the first step from start toward dest, or None"""
+        d = self.next_dir(start, dest)
+        if d is None:
+            return None
+        return (
+            (start[0] + d[0]) % self.width,
+            (start[1] + d[1]) % self.height,
+        )
+
+    def distance(self, start, dest):
+        """Path length in tiles from start to dest, or None if out of reach"""
+        if start == dest:
+            return 0 if self.walkable[start[1] * self.width + start[0]] else None
+        found = self.search(start, dest)
+        return None if found is None else found[1]
+
+
+class FlowFields:
+    """Distance fields toward target tiles, shared by every ghost heading there
+
+    Each field is a breadth-first search out from its target over at most
+    flow_limit tiles, so a query costs four lookups however many ghosts
+    make it. Searches only go as far as the tiles asked about so far, and
+    can be stopped at a deadline and picked up again later. Fields for the
+    most recent targets are kept.
+    """
+
+    capacity = 16
+
+    def __init__(self, width, height, walkable):
+        self.width = width
+        self.height = height
+        self.walkable = walkable  # One flag per tile, row by row
+        # Target tile -> [distances or -1, search queue, tiles reached]
+        self.fields = OrderedDict()
+
+    def grow(self, dest, until=None, deadline=None):
+        """Distances toward dest, searched out until the tile index until is
+        reached or the search is done
+
+        Returns None instead if perf_counter passes deadline first.
+        """
+        entry = self.fields.get(dest)
+        if entry is None:
+            width = self.width
+            field = array("i", [-1]) * (width * self.height)
+            queue = deque()
+            b = dest[1] * width + dest[0]
+            if self.walkable[b]:
+                field[b] = 0
+                queue.append(b)
+            entry = self.fields[dest] = [field, queue, 1]
+            if len(self.fields) > FlowFields.capacity:
+                self.fields.popitem(last=False)
+        else:
+            self.fields.move_to_end(dest)
+        field, queue, reached = entry
+        if until is not None and field[until] >= 0:
+            return field
+        width = self.width
+        height = self.height
+        walkable = self.walkable
+        popped = 0
+        while queue and reached < flow_limit:
+            popped += 1
+            if deadline is not None and popped & 255 == 0:
+                if perf_counter() >= deadline:
+                    entry[2] = reached
+                    return None
+            node = queue.popleft()
+            x = node % width
+            y = node // width
+            step = field[node] + 1
+            for dx, dy in dirs:
+                other = (y + dy) % height * width + (x + dx) % width
+                if field[other] < 0 and walkable[other]:
+                    field[other] = step
+                    queue.append(other)
+                    reached += 1
+            if until is not None and field[until] >= 0:
+                break
+        entry[2] = reached
+        return field
+
+    def next_dir(self, start, dest):
+        """Direction of the first step from start toward dest, or None if the
+        field doesn't reach start"""
+        x, y = start
+        field = self.grow(dest, y * self.width + x)
+        left = field[y * self.width + x]
+        if left <= 0:
+            return None
+        for dx, dy in dirs:
+            other = (y + dy) % self.height * self.width + (x + dx) % self.width
+            if field[other] == left - 1:
+                return (dx, dy)
+        return None
+
+    def path(self, start, dest, deadline=None):
+        """Directions of the first path_limit steps from start to dest, empty
+        if the field doesn't reach start, or None if out of time"""
+        width = self.width
+        height = self.height
+        x, y = start
+        field = self.grow(dest, y * width + x, deadline)
+        if field is None:
+            return None
+        steps = []
+        left = field[y * width + x]
+        while left > 0 and len(steps) < path_limit:
+            for dx, dy in dirs:
+                nx = (x + dx) % width
+                ny = (y + dy) % height
+                if field[ny * width + nx] == left - 1:
+                    steps.append((dx, dy))
+                    x, y, left = nx, ny, left - 1
+                    break
+            else:
+                break
+        return steps
+
+
+tables = {}  # In-memory cache, keyed by board key
+
+
+def load_or_build(key, width, height, walkable):
+    """Get the routes for a board from memory, disk, or by building them
+
+    key identifies the board's layout, and walkable holds one flag per tile.
+    """
+    if key in tables:
+        return tables[key]
+    if sum(walkable) > max_table_nodes:
+        tables[key] = LocalRoutes(width, height, walkable)
+        return tables[key]
+    path = os.path.join(cache_dir, f"routes-{key}.bin")
+    try:
+        table = RouteTable.load(path)
+    except (OSError, ValueError, EOFError):
+        table = RouteTable.build(width, height, walkable)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            table.save(path)
+        except OSError:
+            pass
+    tables[key] = table
+    return table
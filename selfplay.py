@@ -0,0 +1,200 @@
+"""Play many games across all CPU cores and report aggregate statistics
+
+Game constants from main.py can be overridden for every game, to compare
+settings against each other:
+
+    python selfplay.py --games 10000 --agent greedy --set scared_duration=6
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+from statistics import mean, pstdev
+
+import main as rules
+from headless import agents, max_steps, step_dt
+from inputs import AgentInput
+from main import Game, tick_rate
+from telemetry import telemetry
+
+# Constants in main.py that games may override
+tunables = [
+    "speed",
+    "dot_score",
+    "power_score",
+    "ghost_mul",
+    "scared_duration",
+    "eaten_speed_mul",
+    "scared_speed_mul",
+]
+
+
+def start_worker(directory):
+    """Open a telemetry sink for a worker process, closed when it exits
+
+    Pool workers leave without running atexit, but multiprocessing runs
+    its own finalizers first.
+    """
+    telemetry.open(directory)
+    Finalize(telemetry, telemetry.close, exitpriority=10)
+
+
+def play(job):
+    """Play one game in a worker process, returning its statistics"""
+    seed, agent, settings, steps = job
+    for name, value in settings.items():
+        setattr(rules, name, value)
+    game = Game(AgentInput(agents[agent](seed)))
+    game.space()
+    deaths = 0
+    step = 0
+    while step < steps and game.state in (Game.State.Playing, Game.State.Dying):
+        before = game.state
+        game.update(step_dt)
+        step += 1
+        if before == Game.State.Playing and game.state == Game.State.Dying:
+            deaths += 1
+    outcome = {Game.State.Win: "win", Game.State.Lose: "lose"}.get(
+        game.state, "timeout"
+    )
+    return {
+        "seed": seed,
+        "outcome": outcome,
+        "score": game.score,
+        "dots_eaten": game.dots_eaten,
+        "ghosts_eaten": game.ghosts_eaten,
+        "deaths": deaths,
+        "seconds": step / tick_rate,
+    }
+
+
+def describe(values):
+    values = sorted(values)
+    if not values:
+        return None
+
+    def at(p):
+        return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+    return {
+        "mean": mean(values),
+        "std": pstdev(values),
+        "min": values[0],
+        "p10": at(10),
+        "p50": at(50),
+        "p90": at(90),
+        "max": values[-1],
+    }
+
+
+def histogram(values, width):
+    counts = {}
+    for value in values:
+        bin = value // width * width
+        counts[bin] = counts.get(bin, 0) + 1
+    return {f"{bin}-{bin + width - 1}": counts[bin] for bin in sorted(counts)}
+
+
+def summarize(results, score_bin=500):
+    """Aggregate statistics over a list of play() results"""
+    outcomes = [r["outcome"] for r in results]
+    lives_used = [r["deaths"] + (r["outcome"] != "lose") for r in results]
+    return {
+        "games": len(results),
+        "wins": outcomes.count("win"),
+        "losses": outcomes.count("lose"),
+        "timeouts": outcomes.count("timeout"),
+        "win_rate": outcomes.count("win") / len(results),
+        "score": describe([r["score"] for r in results]),
+        "score_histogram": histogram([r["score"] for r in results], score_bin),
+        "dots_eaten": describe([r["dots_eaten"] for r in results]),
+        "ghosts_eaten": describe([r["ghosts_eaten"] for r in results]),
+        "deaths": describe([r["deaths"] for r in results]),
+        "seconds_per_life": describe(
+            [r["seconds"] / lives for r, lives in zip(results, lives_used) if lives]
+        ),
+        "seconds_to_win": describe(
+            [r["seconds"] for r in results if r["outcome"] == "win"]
+        ),
+        "seconds_to_lose": describe(
+            [r["seconds"] for r in results if r["outcome"] == "lose"]
+        ),
+    }
+
+
+def run(
+    games,
+    agent="random",
+    seed=0,
+    settings={},
+    steps=max_steps,
+    workers=None,
+    telemetry_dir=None,
+):
+    """Play games in a process pool, returning every game's statistics"""
+    jobs = [(seed + i, agent, settings, steps) for i in range(games)]
+    workers = workers or os.cpu_count()
+    setup = {}
+    if telemetry_dir:
+        setup = {"initializer": start_worker, "initargs": (telemetry_dir,)}
+    with ProcessPoolExecutor(workers, **setup) as pool:
+        chunk = max(1, games // (workers * 8))
+        return list(pool.map(play, jobs, chunksize=chunk))
+
+
+def parse_setting(text):
+    name, _, value = text.partition("=")
+    if name not in tunables:
+        raise argparse.ArgumentTypeError(f"{name} is not one of {', '.join(tunables)}")
+    try:
+        return name, type(getattr(rules, name))(value)
+    except ValueError:
+        return name, float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--agent", choices=agents, default="greedy")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--steps", type=int, default=max_steps)
+    parser.add_argument("--workers", type=int, help="default one per CPU core")
+    parser.add_argument(
+        "--set",
+        type=parse_setting,
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="override a constant from main.py",
+    )
+    parser.add_argument("--output", help="also write the summary to this JSON file")
+    parser.add_argument(
+        "--telemetry", metavar="DIR", help="record game events, see telemetry.py"
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = run(
+        args.games,
+        args.agent,
+        args.seed,
+        dict(args.set),
+        args.steps,
+        args.workers,
+        args.telemetry,
+    )
+    elapsed = time.perf_counter() - start
+    summary = summarize(results)
+    summary["settings"] = dict(args.set)
+    summary["elapsed"] = elapsed
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
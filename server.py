@@ -0,0 +1,384 @@
+"""Stream a live game to any number of spectators over TCP
+
+The server runs the only real Game. A client gets the maze and a keyframe
+when it connects, then a delta every broadcast holding only what changed:
+quantized positions, tiles set on the board, score, lives and timers.
+Clients acknowledge every message they read. One that falls too far
+behind is sent nothing more until it has read what is already on the way,
+then gets a fresh keyframe, so one slow display never holds back the rest.
+
+    python server.py --agent greedy
+    python spectator.py localhost
+"""
+
+import argparse
+import asyncio
+import os
+import struct
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from pygame import Vector2
+
+from headless import agents
+from inputs import AgentInput
+from main import Game, Ghost, max_catch_up, tick_rate, tile_codes
+from maze import open_maze
+from replay import directions, encode_state, read_varint, write_varint
+from timestep import FixedTimestep
+
+default_port = 7777
+send_rate = 30  # Broadcasts per second
+queue_limit = 64  # Messages sent but not yet read before a client is resynced
+position_units = 64  # Steps per tile that positions are quantized to
+restart_delay = 3  # Seconds a finished game is shown before the next starts
+
+# Message types
+maze_message = b"M"
+keyframe_message = b"K"
+delta_message = b"D"
+input_message = b"I"
+ack_message = b"A"  # Number of messages read so far, from a client
+frame_header = struct.Struct("<cI")
+ack_format = struct.Struct("<I")
+
+# Delta flags, for the fields that changed
+changed_state = 1
+changed_score = 2
+changed_lives = 4
+changed_scared = 8
+changed_pac = 16
+changed_ghosts = 32
+changed_tiles = 64
+
+
+def frame(kind, body):
+    return frame_header.pack(kind, len(body)) + body
+
+
+async def read_frame(reader):
+    """Type and body of the next message, or None at the end of the stream"""
+    try:
+        header = await reader.readexactly(frame_header.size)
+        kind, length = frame_header.unpack(header)
+        return kind, await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+def quantize(pos):
+    """Position in whole position_units, folded to be non-negative
+
+    Entities stray a little past the edge while going through a tunnel, so
+    signs are kept by zigzag: 0, -1, 1, -2... become 0, 1, 2, 3...
+    """
+    x = round(pos.x * position_units)
+    y = round(pos.y * position_units)
+    return (x << 1 ^ x >> 63, y << 1 ^ y >> 63)
+
+
+def unquantize(x, y):
+    return Vector2(x >> 1 ^ -(x & 1), y >> 1 ^ -(y & 1)) / position_units
+
+
+def pac_fields(pac):
+    # The chomp repeats four times a second, so only its phase is sent
+    phase = int(pac.anim_timer * 4 % 1 * 256)
+    return (*quantize(pac.pos), round(pac.size * 255), phase)
+
+
+class DeltaEncoder:
+    """Describe how a game changed since the last delta or keyframe"""
+
+    def __init__(self, game):
+        self.game = game
+        self.board = None
+        self.tiles = []  # (x, y, tile) set since the last delta
+        self.keyframe()
+
+    def tile_changed(self, x, y, tile):
+        self.tiles.append((x, y, tile))
+
+    def keyframe(self):
+        """Encode the whole game, which later deltas build on"""
+        game = self.game
+        if self.board is not game.board:
+            if self.board:
+                self.board.listeners.remove(self.tile_changed)
+            self.board = game.board
+            self.board.listeners.append(self.tile_changed)
+        self.tiles = []
+        self.state = game.state
+        self.score = game.score
+        self.lives = game.lives
+        self.scared = round(game.scared_timer * 100)
+        self.pac = pac_fields(game.pac)
+        self.ghosts = [(*quantize(g.pos), g.state.value) for g in game.ghosts]
+        return encode_state(game)
+
+    def delta(self):
+        """Encoded changes, or None if nothing changed
+
+        Returns a keyframe instead when the game was restarted, as
+        keyframe_message or delta_message and the body.
+        """
+        game = self.game
+        if game.board is not self.board:
+            return keyframe_message, self.keyframe()
+        flags = 0
+        body = bytearray()
+        if game.state != self.state:
+            self.state = game.state
+            flags |= changed_state
+            body.append(game.state)
+        if game.score != self.score:
+            self.score = game.score
+            flags |= changed_score
+            write_varint(body, game.score)
+        if game.lives != self.lives:
+            self.lives = game.lives
+            flags |= changed_lives
+            write_varint(body, game.lives)
+        scared = round(game.scared_timer * 100)
+        if scared != self.scared:
+            self.scared = scared
+            flags |= changed_scared
+            write_varint(body, scared)
+        pac = pac_fields(game.pac)
+        if pac != self.pac:
+            self.pac = pac
+            flags |= changed_pac
+            for value in pac:
+                write_varint(body, value)
+        moved = []
+        for i, ghost in enumerate(game.ghosts):
+            fields = (*quantize(ghost.pos), ghost.state.value)
+            if fields != self.ghosts[i]:
+                self.ghosts[i] = fields
+                moved.append((i, fields))
+        if moved:
+            flags |= changed_ghosts
+            write_varint(body, len(moved))
+            for i, (x, y, state) in moved:
+                write_varint(body, i)
+                write_varint(body, x)
+                write_varint(body, y)
+                body.append(state)
+        if self.tiles:
+            flags |= changed_tiles
+            write_varint(body, len(self.tiles))
+            for x, y, tile in self.tiles:
+                write_varint(body, x)
+                write_varint(body, y)
+                body.append(tile.value)
+            self.tiles = []
+        if not flags:
+            return None
+        return delta_message, bytes([flags]) + body
+
+
+def apply_delta(game, data):
+    """Update a spectator's game from a delta, keeping the previous
+    positions for interpolation"""
+    flags = data[0]
+    i = 1
+    if flags & changed_state:
+        game.state = data[i]
+        i += 1
+    if flags & changed_score:
+        game.score, i = read_varint(data, i)
+    if flags & changed_lives:
+        game.lives, i = read_varint(data, i)
+    if flags & changed_scared:
+        scared, i = read_varint(data, i)
+        game.scared_timer = scared / 100
+    pac = game.pac
+    pac.prev_pos = pac.pos
+    if flags & changed_pac:
+        x, i = read_varint(data, i)
+        y, i = read_varint(data, i)
+        size, i = read_varint(data, i)
+        phase, i = read_varint(data, i)
+        pac.pos = unquantize(x, y)
+        pac.size = size / 255
+        pac.anim_timer = phase / 256 / 4
+    for ghost in game.ghosts:
+        ghost.prev_pos = ghost.pos
+    if flags & changed_ghosts:
+        count, i = read_varint(data, i)
+        for _ in range(count):
+            n, i = read_varint(data, i)
+            x, i = read_varint(data, i)
+            y, i = read_varint(data, i)
+            ghost = game.ghosts[n]
+            ghost.pos = unquantize(x, y)
+            ghost.state = Ghost.State(data[i])
+            i += 1
+    if flags & changed_tiles:
+        count, i = read_varint(data, i)
+        for _ in range(count):
+            x, i = read_varint(data, i)
+            y, i = read_varint(data, i)
+            game.board.set(x, y, tile_codes[data[i]])
+            i += 1
+
+
+class RemoteInput:
+    """Directions from the last client to send one, else from an agent"""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.code = None
+        self.client = None  # Client that sent code
+
+    def direction(self, game):
+        if self.code is None:
+            return self.fallback.direction(game)
+        return directions[self.code]
+
+
+class Client:
+    def __init__(self, writer):
+        self.writer = writer
+        self.queue = asyncio.Queue()
+        self.sent = 0  # Messages written to the connection
+        self.acked = 0  # Messages the client says it has read
+        self.stale = True  # Needs a keyframe before deltas mean anything
+        self.dropped = 0  # Messages thrown away to resync
+
+    def behind(self):
+        """Messages queued or on the way that the client hasn't read yet
+
+        Socket buffers on both ends can hold far more than queue_limit small
+        deltas, so only the client's acknowledgements tell how far behind
+        its display is.
+        """
+        return self.queue.qsize() + self.sent - self.acked
+
+    def send(self, message):
+        if self.behind() >= queue_limit:
+            # Too far behind to catch up, so start over from a keyframe
+            self.dropped += 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.stale = True
+            return
+        self.queue.put_nowait(message)
+
+    async def pump(self):
+        """Write queued messages as fast as the connection takes them"""
+        while True:
+            message = await self.queue.get()
+            self.writer.write(message)
+            self.sent += 1
+            await self.writer.drain()
+
+
+class Server:
+    def __init__(self, game):
+        self.game = game
+        self.encoder = DeltaEncoder(game)
+        self.clients = set()
+        self.timestep = FixedTimestep(1 / tick_rate, max_catch_up)
+        self.send_every = max(1, round(tick_rate / send_rate))
+        self.over_time = 0
+
+    def update(self, dt):
+        game = self.game
+        if game.state in (Game.State.Lose, Game.State.Win, Game.State.Start):
+            self.over_time += dt
+            if self.over_time >= restart_delay or game.state == Game.State.Start:
+                self.over_time = 0
+                game.space()
+        game.update(dt)
+        if self.timestep.ticks % self.send_every == 0:
+            self.broadcast()
+
+    def broadcast(self):
+        delta = self.encoder.delta()
+        keyframe = None
+        if delta and delta[0] == keyframe_message:
+            keyframe = frame(*delta)
+            delta = None
+        elif delta:
+            delta = frame(*delta)
+        for client in self.clients:
+            if client.stale:
+                if client.behind():
+                    client.dropped += 1  # Still reading what it was sent before
+                    continue
+                if keyframe is None:
+                    keyframe = frame(keyframe_message, encode_state(self.game))
+                client.stale = False
+                client.send(keyframe)
+            elif keyframe:
+                client.send(keyframe)
+            elif delta:
+                client.send(delta)
+
+    async def handle(self, reader, writer):
+        client = Client(writer)
+        client.send(frame(maze_message, self.game.maze.pack()))
+        self.clients.add(client)
+        pump = asyncio.create_task(client.pump())
+        try:
+            while True:
+                message = await read_frame(reader)
+                if message is None:
+                    break
+                kind, body = message
+                if kind == ack_message and len(body) == ack_format.size:
+                    (client.acked,) = ack_format.unpack(body)
+                elif kind == input_message and body:
+                    self.game.input.code = body[0] % len(directions)
+                    self.game.input.client = client
+        finally:
+            # Hand Pacman back to the agent when the player leaves
+            if self.game.input.client is client:
+                self.game.input.code = None
+                self.game.input.client = None
+            self.clients.discard(client)
+            pump.cancel()
+            writer.close()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        last = loop.time()
+        while True:
+            await asyncio.sleep(self.timestep.step)
+            now = loop.time()
+            self.timestep.advance(now - last, self.update)
+            last = now
+
+
+async def serve(game, host, port):
+    server = Server(game)
+    listener = await asyncio.start_server(server.handle, host, port)
+    print(f"Serving on {host}:{port}")
+    async with listener:
+        await server.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a live game to spectators")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument(
+        "--agent", choices=agents, default="greedy", help="plays until a client does"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--maze", help="maze file, or WIDTHxHEIGHT to generate one")
+    parser.add_argument("--crowd", type=int, default=0, help="extra ghosts to add")
+    args = parser.parse_args()
+    maze = args.maze and open_maze(args.maze, args.seed)
+    input = RemoteInput(AgentInput(agents[args.agent](args.seed)))
+    game = Game(input, maze, args.crowd)
+    try:
+        asyncio.run(serve(game, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Uniform grid of ghosts, for finding the ones near a point"""
+
+
+class SpatialHash:
+    def __init__(self, ghosts, cell=2):
+        self.cell = cell  # Tiles along each side of a grid cell
+        self.buckets = {}  # (cx, cy) -> ghosts in the cell
+        self.cells = {}  # Ghost id -> its cell
+        for ghost in ghosts:
+            self.move(ghost)
+
+    def key(self, x, y):
+        return (int(x // self.cell), int(y // self.cell))
+
+    def move(self, ghost):
+        """File a ghost under the cell of its current position"""
+        key = self.key(ghost.store.x[ghost.index], ghost.store.y[ghost.index])
+        old = self.cells.get(ghost.id)
+        if old == key:
+            return
+        if old is not None:
+            self.buckets[old].remove(ghost)
+        self.buckets.setdefault(key, []).append(ghost)
+        self.cells[ghost.id] = key
+
+    def near(self, x, y):
+        """Ghosts filed in the cells around (x, y), by id
+
+        Ghosts are filed where they last reached a tile, so they may have
+        moved up to a tile since. Every ghost within cell - 1 tiles of the
+        point is found.
+        """
+        cx, cy = self.key(x, y)
+        found = []
+        for y in range(cy - 1, cy + 2):
+            for x in range(cx - 1, cx + 2):
+                found.extend(self.buckets.get((x, y), ()))
+        found.sort(key=lambda ghost: ghost.id)
+        return found
+
+    def copy(self, ghosts):
+        """Grid over copies of the ghosts, which have the same ids"""
+        return SpatialHash(ghosts, self.cell)
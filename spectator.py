@@ -0,0 +1,123 @@
+"""Watch, or with --play control, a game streamed by server.py
+
+The game here never runs its own update. It is restored from each keyframe
+and patched by each delta, and drawn between deltas by interpolating from
+the positions the last one replaced.
+"""
+
+import argparse
+import asyncio
+import os
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+from inputs import IdleInput, KeyboardInput
+from main import Game
+from maze import Maze
+from replay import decode_state, encode_dir, game_format
+from server import (
+    ack_format,
+    ack_message,
+    apply_delta,
+    default_port,
+    delta_message,
+    frame,
+    input_message,
+    keyframe_message,
+    maze_message,
+    read_frame,
+    send_rate,
+)
+
+
+class Spectator:
+    def __init__(self):
+        self.maze = None
+        self.game = None
+        self.received = 0  # Time of the last delta, for interpolation
+        self.count = 0  # Messages read, acknowledged to the server
+        self.closed = False
+
+    def receive(self, kind, body, now):
+        if kind == maze_message:
+            self.maze = Maze.unpack(body)
+            self.game = None
+        elif kind == keyframe_message:
+            count = game_format.unpack_from(body)[-1]
+            game = self.game
+            if game is None or len(game.ghosts) != count:
+                crowd = count - len(self.maze.ghosts)
+                game = self.game = Game(IdleInput(), self.maze, crowd)
+            decode_state(game, body)
+            self.received = now
+        elif kind == delta_message and self.game:
+            apply_delta(self.game, body)
+            self.received = now
+
+    async def listen(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await read_frame(reader)
+            if message is None:
+                break
+            self.receive(*message, loop.time())
+            self.count += 1
+            writer.write(frame(ack_message, ack_format.pack(self.count)))
+        self.closed = True
+
+
+async def watch(host, port, play):
+    reader, writer = await asyncio.open_connection(host, port)
+    spectator = Spectator()
+    listener = asyncio.create_task(spectator.listen(reader, writer))
+    loop = asyncio.get_running_loop()
+
+    pygame.display.init()
+    pygame.display.set_caption(f"PAC-MAN - {host}:{port}")
+    screen = pygame.display.set_mode((1280, 720), pygame.RESIZABLE)
+    keyboard = KeyboardInput()
+    sent = None
+
+    # Main loop, yielding to the connection between frames
+    while not spectator.closed:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                spectator.closed = True
+        game = spectator.game
+        if game:
+            if play:
+                code = encode_dir(keyboard.direction(game))
+                if code != sent:
+                    sent = code
+                    writer.write(frame(input_message, bytes([code])))
+            alpha = min(1, (loop.time() - spectator.received) * send_rate)
+            rects = game.render(screen, alpha)
+            if rects is None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(rects)
+        await asyncio.sleep(1 / 120)
+
+    listener.cancel()
+    writer.close()
+    pygame.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch a game from server.py")
+    parser.add_argument("host", nargs="?", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument(
+        "--play", action="store_true", help="steer Pacman with the keyboard"
+    )
+    args = parser.parse_args()
+    try:
+        asyncio.run(watch(args.host, args.port, args.play))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
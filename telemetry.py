@@ -0,0 +1,253 @@
+"""Game events recorded in columns and written out in the background
+
+Games report what happened to the process-wide telemetry sink, which keeps
+events in a fixed-size buffer of columns. Full buffers are handed to a
+writer thread that compresses each column and saves them as one chunk
+file, so the game loop never waits on the disk. If the writer falls more
+than backlog chunks behind, whole buffers are dropped and counted instead.
+
+    python headless.py --games 1000 --telemetry runs/
+    python telemetry.py runs/
+
+Reading streams the chunks one at a time and requires numpy.
+"""
+
+import argparse
+import atexit
+import glob
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import zlib
+from array import array
+
+# Event kinds
+start = 0  # value: number of ghosts
+dot = 1  # value: score after eating it
+power = 2  # value: score after eating it
+ghost = 3  # value: multiplier of the points for the ghost, x: its id
+death = 4  # value: lives left
+win = 5  # value: final score
+lose = 6  # value: final score
+phase = 7  # value: 1 when ghosts start scattering, 0 when they start chasing
+kinds = ["start", "dot", "power", "ghost", "death", "win", "lose", "phase"]
+
+# Columns by name and array typecode
+columns = [
+    ("game", "Q"),  # Unique game id, a random per-process token and a count
+    ("time", "f"),  # Board.time of the event, in seconds
+    ("kind", "B"),
+    ("value", "i"),
+    ("x", "H"),  # Tile, where there is one
+    ("y", "H"),
+]
+
+magic = b"PACTEL"
+version = 1
+header_format = struct.Struct("<6sBIB")
+column_format = struct.Struct("<8scI")
+suffix = ".pactel"
+
+
+def empty_columns(size):
+    return [array(code, bytes(array(code).itemsize * size)) for _, code in columns]
+
+
+class Telemetry:
+    capacity = 65536  # Events per chunk
+    backlog = 4  # Full chunks waiting for the writer before events are dropped
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.token = 0
+        self.games = 0
+        self.buffer = None
+        self.count = 0  # Events in the current buffer
+        self.dropped = 0  # Events thrown away while the writer was behind
+        self.chunks = 0  # Chunks handed to the writer
+        self.written = 0  # Chunks saved by the writer
+        self.pending = None
+        self.spare = None
+        self.thread = None
+
+    def open(self, directory):
+        """Start recording events into chunk files in directory"""
+        if self.enabled:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.token = int.from_bytes(os.urandom(4), "little")
+        self.buffer = empty_columns(Telemetry.capacity)
+        self.count = 0
+        self.pending = queue.Queue(Telemetry.backlog)
+        self.spare = queue.SimpleQueue()  # Written buffers, for reuse
+        self.thread = threading.Thread(target=self.write_chunks, daemon=True)
+        self.thread.start()
+        self.enabled = True
+        atexit.register(self.close)
+
+    def begin(self):
+        """Id for a new game"""
+        self.games += 1
+        return self.token << 32 | self.games
+
+    def record(self, game, time, kind, value=0, x=0, y=0):
+        i = self.count
+        buffer = self.buffer
+        buffer[0][i] = game
+        buffer[1][i] = time
+        buffer[2][i] = kind
+        buffer[3][i] = value
+        buffer[4][i] = x
+        buffer[5][i] = y
+        self.count = i + 1
+        if self.count == Telemetry.capacity:
+            self.flush()
+
+    def flush(self):
+        """Hand the buffered events to the writer, or drop them if it is behind"""
+        if not self.count:
+            return
+        try:
+            self.pending.put_nowait((self.buffer, self.count))
+        except queue.Full:
+            self.dropped += self.count
+        else:
+            self.chunks += 1
+            try:
+                self.buffer = self.spare.get_nowait()
+            except queue.Empty:
+                self.buffer = empty_columns(Telemetry.capacity)
+        self.count = 0
+
+    def close(self):
+        """Write out everything buffered and stop the writer"""
+        if not self.enabled:
+            return
+        self.enabled = False
+        self.flush()
+        self.pending.put(None)
+        self.thread.join()
+        atexit.unregister(self.close)
+
+    def write_chunks(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            buffer, count = item
+            self.written += 1
+            name = f"{self.token:08x}-{self.written:06d}{suffix}"
+            write_chunk(os.path.join(self.directory, name), buffer, count)
+            self.spare.put(buffer)
+
+
+def write_chunk(path, buffer, count):
+    """Save the first count rows of each column, compressed separately"""
+    parts = [header_format.pack(magic, version, count, len(columns))]
+    for (name, code), column in zip(columns, buffer):
+        values = column[:count]
+        if sys.byteorder == "big":
+            values.byteswap()
+        data = zlib.compress(values.tobytes(), 6)
+        parts.append(column_format.pack(name.encode(), code.encode(), len(data)))
+        parts.append(data)
+
+    # Readers skip files until they are complete
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(b"".join(parts))
+    os.replace(temp, path)
+
+
+telemetry = Telemetry()
+
+
+def read_chunk(path):
+    """Columns of a chunk file as numpy arrays, by name"""
+    import numpy as np
+
+    with open(path, "rb") as f:
+        data = f.read()
+    file_magic, file_version, count, ncolumns = header_format.unpack_from(data)
+    if file_magic != magic or file_version != version:
+        raise ValueError(f"{path} is not a version {version} telemetry chunk")
+    i = header_format.size
+    chunk = {}
+    for _ in range(ncolumns):
+        name, code, length = column_format.unpack_from(data, i)
+        i += column_format.size
+        dtype = np.dtype(code.decode()).newbyteorder("<")
+        values = np.frombuffer(zlib.decompress(data[i : i + length]), dtype)
+        if len(values) != count:
+            raise EOFError(f"{path} is truncated")
+        chunk[name.rstrip(b"\0").decode()] = values
+        i += length
+    return chunk
+
+
+def chunk_paths(sources):
+    """Chunk files in the given files and directories"""
+    for source in sources:
+        if os.path.isdir(source):
+            yield from sorted(glob.glob(os.path.join(source, "*" + suffix)))
+        else:
+            yield source
+
+
+def summarize(sources, score_bin=500, time_bin=10):
+    """Aggregate every chunk under sources, one chunk in memory at a time"""
+    import numpy as np
+
+    counts = np.zeros(len(kinds), np.int64)
+    multipliers = {}
+    scores = {}
+    death_times = {}
+    score_total = 0
+    chunks = 0
+    for path in chunk_paths(sources):
+        chunk = read_chunk(path)
+        chunks += 1
+        kind = chunk["kind"]
+        counts += np.bincount(kind, minlength=len(kinds))[: len(kinds)]
+        for key, values, bin in [
+            (multipliers, chunk["value"][kind == ghost], 1),
+            (scores, chunk["value"][(kind == win) | (kind == lose)], score_bin),
+            (death_times, chunk["time"][kind == death], time_bin),
+        ]:
+            bins, n = np.unique(values // bin * bin, return_counts=True)
+            for b, c in zip(bins.tolist(), n.tolist()):
+                key[int(b)] = key.get(int(b), 0) + c
+        score_total += int(chunk["value"][(kind == win) | (kind == lose)].sum())
+
+    ended = int(counts[win] + counts[lose])
+    by_kind = dict(zip(kinds, counts.tolist()))
+    return {
+        "chunks": chunks,
+        "events": by_kind,
+        "games": by_kind["start"],
+        "win_rate": by_kind["win"] / ended if ended else None,
+        "mean_score": score_total / ended if ended else None,
+        "score_histogram": {
+            f"{b}-{b + score_bin - 1}": scores[b] for b in sorted(scores)
+        },
+        "ghost_multipliers": {str(b): multipliers[b] for b in sorted(multipliers)},
+        "deaths_by_time": {
+            f"{b}-{b + time_bin}s": death_times[b] for b in sorted(death_times)
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize recorded telemetry")
+    parser.add_argument("sources", nargs="+", help="chunk files or directories")
+    args = parser.parse_args()
+    print(json.dumps(summarize(args.sources), indent=2))
+
+
+if __name__ == "__main__":
+    main()
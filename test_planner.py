@@ -0,0 +1,32 @@
+"""Ghost routes planned under a budget stay on the maze"""
+
+import os
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from headless import RandomAgent, step_dt
+from inputs import AgentInput
+from main import Game, wall
+from maze import open_maze
+
+
+def test_tiny_budget_keeps_ghosts_out_of_walls():
+    # One microsecond leaves most requests pending while goals change
+    game = Game(AgentInput(RandomAgent(2)), open_maze("101x101", 3), 50, 1)
+    game.space()
+    board = game.board
+    store = game.entities
+    for step in range(4000):
+        if game.state not in (Game.State.Playing, Game.State.Dying):
+            game.space()
+            board = game.board
+            store = game.entities
+        game.update(step_dt)
+        for ghost in game.ghosts:
+            i = ghost.index
+            tiles = [(store.x[i], store.y[i])]
+            if store.moving[i]:
+                tiles.append((store.dest_x[i], store.dest_y[i]))
+            for x, y in tiles:
+                cell = int(y) % board.height * board.width + int(x) % board.width
+                assert board.cells[cell] != wall, (step, ghost.id, x, y)
@@ -0,0 +1,60 @@
+"""Spectators that read slowly are resynced instead of falling behind"""
+
+import asyncio
+import os
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import server
+from headless import GreedyAgent
+from inputs import AgentInput
+from main import Game
+from server import (
+    RemoteInput,
+    Server,
+    ack_format,
+    ack_message,
+    frame,
+    keyframe_message,
+    read_frame,
+    send_rate,
+)
+
+
+async def watch_slowly(seconds, reads_per_second):
+    game = Game(RemoteInput(AgentInput(GreedyAgent(0))))
+    host = Server(game)
+    listener = await asyncio.start_server(host.handle, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    running = asyncio.create_task(host.run())
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+    loop = asyncio.get_running_loop()
+    end = loop.time() + seconds
+    read = 0
+    keyframes = 0
+    most_behind = 0
+    while loop.time() < end:
+        kind, _ = await read_frame(reader)
+        read += 1
+        keyframes += kind == keyframe_message
+        writer.write(frame(ack_message, ack_format.pack(read)))
+        for client in host.clients:
+            most_behind = max(most_behind, client.behind())
+        await asyncio.sleep(1 / reads_per_second)
+    client = next(iter(host.clients))
+
+    writer.close()
+    await writer.wait_closed()
+    await asyncio.sleep(0.1)  # Let the server see the connection close
+    running.cancel()
+    listener.close()
+    return client, keyframes, most_behind
+
+
+def test_slow_reader_is_resynced(monkeypatch):
+    monkeypatch.setattr(server, "queue_limit", 8)
+    client, keyframes, most_behind = asyncio.run(watch_slowly(2, send_rate / 3))
+    assert client.dropped > 0
+    assert keyframes >= 2  # The first one and at least one resync
+    assert most_behind <= 8
@@ -0,0 +1,87 @@
+"""Bounded LRU caches for fonts and rendered text surfaces"""
+
+from collections import OrderedDict
+
+import pygame
+
+
+class TextCache:
+    def __init__(self, max_font_bytes=4 * 1024 * 1024, max_bytes=8 * 1024 * 1024):
+        self.max_font_bytes = max_font_bytes  # Estimated glyph memory of fonts kept
+        self.max_bytes = max_bytes  # Pixel memory of rendered surfaces kept
+        self.fonts = OrderedDict()
+        self.surfaces = OrderedDict()
+        self.font_bytes = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.font_hits = 0
+        self.font_misses = 0
+        self.evictions = 0
+        self.font_evictions = 0
+
+    def font(self, size):
+        font = self.fonts.get(size)
+        if font is not None:
+            self.font_hits += 1
+            self.fonts.move_to_end(size)
+            return font
+        self.font_misses += 1
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = pygame.font.Font(pygame.font.get_default_font(), size)
+        self.fonts[size] = font
+        self.font_bytes += font_bytes(size)
+        while self.font_bytes > self.max_font_bytes and len(self.fonts) > 1:
+            old, _ = self.fonts.popitem(last=False)
+            self.font_bytes -= font_bytes(old)
+            self.font_evictions += 1
+        return font
+
+    def render(self, str, size, color):
+        """Rendered text surface, shared between callers so never draw on it"""
+        key = (str, size, tuple(pygame.Color(color)))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = self.font(size).render(str, True, color)
+        self.surfaces[key] = surface
+        self.bytes += surface_bytes(surface)
+        while self.bytes > self.max_bytes and len(self.surfaces) > 1:
+            _, old = self.surfaces.popitem(last=False)
+            self.bytes -= surface_bytes(old)
+            self.evictions += 1
+        return surface
+
+    def clear(self):
+        self.fonts.clear()
+        self.surfaces.clear()
+        self.font_bytes = 0
+        self.bytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "surfaces": len(self.surfaces),
+            "bytes": self.bytes,
+            "fonts": len(self.fonts),
+            "font_bytes": self.font_bytes,
+            "font_hits": self.font_hits,
+            "font_misses": self.font_misses,
+            "font_evictions": self.font_evictions,
+        }
+
+
+def surface_bytes(surface):
+    return surface.get_height() * surface.get_pitch()
+
+
+def font_bytes(size):
+    """Rough memory of a font at size once its printable ASCII glyphs are
+    cached, one byte per pixel of a size by size cell each"""
+    return 96 * size * size
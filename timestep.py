@@ -0,0 +1,54 @@
+"""Fixed-timestep scheduling, decoupling the simulation from the frame rate"""
+
+import pygame
+
+
+class FixedTimestep:
+    def __init__(self, step, max_steps):
+        self.step = step  # Simulated seconds per update
+        self.max_steps = max_steps  # Most updates run for a single frame
+        self.accumulator = 0
+        self.ticks = 0  # Updates run so far
+
+    def advance(self, elapsed, update):
+        """Call update(step) once per whole step elapsed
+
+        Returns how far the simulation is into the next step, from 0 to 1,
+        for interpolating what gets drawn.
+        """
+        self.accumulator += elapsed
+        steps = 0
+        while self.accumulator >= self.step and steps < self.max_steps:
+            update(self.step)
+            self.accumulator -= self.step
+            self.ticks += 1
+            steps += 1
+
+        # Drop time that couldn't be caught up on instead of spiraling
+        if self.accumulator >= self.step:
+            self.accumulator %= self.step
+        return self.accumulator / self.step
+
+
+class FramePacer:
+    """Wait for the next frame, as often as fps allows while something is
+    moving, or until an event arrives while the screen is still"""
+
+    def __init__(self, fps, idle_timeout=0.5):
+        self.fps = fps  # Most frames per second while animating, 0 for no cap
+        self.idle_timeout = idle_timeout  # Longest wait for an event when idle
+        self.clock = pygame.time.Clock()
+
+    def wait(self, animating):
+        """Seconds of simulation time since the last frame
+
+        Idle waits count as no time, so a game started from an idle screen
+        doesn't jump ahead by however long it sat there.
+        """
+        if animating:
+            return self.clock.tick(self.fps) / 1000
+        event = pygame.event.wait(int(self.idle_timeout * 1000))
+        if event.type != pygame.NOEVENT:
+            pygame.event.post(event)
+        self.clock.tick()
+        return 0